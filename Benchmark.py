@@ -0,0 +1,106 @@
+# Benchmark of OLSR's link state refresh modes, 'periodic' against 'adaptive' (see OLSRSimulation)
+#
+# Every scenario builds the same swarms for both modes, so the modes are compared on the same
+# topologies and movement. OLSR's step time is measured on its own, without AODV and the custom
+# protocol that run alongside it in Simulation.
+#
+# From a shell:
+#     python Benchmark.py                   every scenario
+#     python Benchmark.py static-15 fast    some of them
+
+import sys
+import time
+
+import numpy as np
+
+from simulation import Grid, Simulation
+from Mobility import ContinuousSwarm, RandomWaypoint
+
+__all__ = ['SCENARIOS', 'compareRefresh', 'refreshBenchmark']
+
+def waypoints(minSpeed, maxSpeed):
+    # 200 nodes moving on a 100 x 100 area with no pauses
+    return lambda seed: ContinuousSwarm(RandomWaypoint(200, 100, minSpeed=minSpeed, maxSpeed=maxSpeed, maxPause=0,
+                                                       rng=np.random.default_rng(seed)), r_rad=14)
+
+# name -> (function of a seed that builds a swarm, number of trials)
+SCENARIOS = {
+    'static-30': (lambda seed: Grid(30, r_rad=6, m_rad=0, seed=seed, num_nodes=180), 6),
+    'static-15': (lambda seed: Grid(15, r_rad=6, m_rad=0, seed=seed), 20),
+    'slow': (waypoints(0.02, 0.05), 6),
+    'fast': (waypoints(0.5, 1.5), 6),
+    'grid-30': (lambda seed: Grid(30, r_rad=6, m_rad=3, seed=seed, num_nodes=180), 6),
+}
+
+def compareRefresh(makeSwarm, numTrials, maxTimeslots=3000):
+    """
+        Run OLSR with both refresh modes on the same swarms.
+
+        Parameters
+        ----------
+        makeSwarm: function
+            builds the swarm of a trial from its seed, 0 to numTrials - 1
+        numTrials: int
+            number of swarms
+        maxTimeslots: int
+            timeslot at which a simulation is cut off
+
+        Returns
+        -------
+        :dict
+            for 'periodic' and 'adaptive': mean finish timeslot and overhead of the trials
+            OLSR finished, summed OLSR step time in seconds, and the number of trials cut off
+    """
+    results = {}
+    for mode in ('periodic', 'adaptive'):
+        finish = []
+        overhead = []
+        elapsed = [0.0]
+        for seed in range(numTrials):
+            sim = Simulation(makeSwarm(seed), maxTimeslots, run=False, olsrRefresh=mode)
+            step = sim.olsr.step
+            def timed(*args, step=step):
+                start = time.perf_counter()
+                step(*args)
+                elapsed[0] += time.perf_counter() - start
+            sim.olsr.step = timed
+            sim.run()
+            if sim.olsr.isFinished():
+                finish.append(sim.olsr.returnTimeslots())
+                overhead.append(sim.olsr.returnOverhead())
+        results[mode] = {'finish': float(np.mean(finish)) if finish else None,
+                         'overhead': float(np.mean(overhead)) if overhead else None,
+                         'stepTime': elapsed[0],
+                         'cutOff': numTrials - len(finish)}
+    return results
+
+def refreshBenchmark(names=None, maxTimeslots=3000, out=None):
+    """
+        Run the refresh mode comparison on the scenarios in SCENARIOS.
+
+        Parameters
+        ----------
+        names: list
+            scenarios to run, all of them if None
+        maxTimeslots: int
+            timeslot at which a simulation is cut off
+        out: file
+            where to print one line per scenario and mode, nowhere if None
+
+        Returns
+        -------
+        :dict
+            the results of compareRefresh() for each scenario
+    """
+    results = {}
+    for name in (names or list(SCENARIOS)):
+        makeSwarm, numTrials = SCENARIOS[name]
+        results[name] = compareRefresh(makeSwarm, numTrials, maxTimeslots)
+        if out is not None:
+            for mode, r in results[name].items():
+                print(name, mode, 'finish', r['finish'], 'overhead', r['overhead'],
+                      'OLSR step time %.2fs' % r['stepTime'], 'cut off', r['cutOff'], file=out, flush=True)
+    return results
+
+if __name__ == '__main__':
+    refreshBenchmark(sys.argv[1:] or None, out=sys.stdout)
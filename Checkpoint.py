@@ -0,0 +1,98 @@
+# Checkpoints: snapshots of a running simulation that can be restored later
+#
+# A snapshot holds the whole simulation object (grid positions and neighbors, queues,
+# protocol tables, and the numpy Generators the grid and protocols draw from), so a
+# restored simulation continues exactly where the original left off. The state of the
+# global numpy and random generators is saved too, for code that still draws from them.
+#
+# Format: 8 byte magic, 4 byte little endian format version, then a zlib compressed pickle.
+#
+# The pickle stores every object's attributes as they are, so the layout of the saved state
+# is the layout of the classes (Grid, Node, the packets, queues, route cache and protocol
+# simulations). VERSION covers that layout: any change that adds, removes, renames or changes
+# the type of an attribute of those classes must increase VERSION, so that older checkpoints
+# are rejected with a clear error instead of failing later inside run().
+
+import os, pickle, random, struct, zlib
+import numpy as np
+
+MAGIC = b'SWARMCKP'
+# 1: the first format
+# 2: OLSR link state refresh modes (dict routing tables, linked LinkState paths), and the
+#    other attribute changes since 1: Generators, node churn, flows, route caches and
+#    CustomSimulation without a route cache
+# 3: the route cache's clock
+VERSION = 3
+HEADER = struct.Struct('<8sI')
+
+def snapshot(simulation):
+    """
+        Serialize a simulation and the global RNG state.
+
+        Parameters
+        ----------
+        simulation: object
+            the simulation to save, e.g. a Simulation created with run=False
+
+        Returns
+        -------
+        :bytes
+            the snapshot
+    """
+    state = {'simulation': simulation,
+             'numpy': np.random.get_state(),
+             'random': random.getstate()}
+    payload = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    return HEADER.pack(MAGIC, VERSION) + payload
+
+def restore(data, restoreRNG=True):
+    """
+        Rebuild a simulation from a snapshot.
+
+        Parameters
+        ----------
+        data: bytes
+            a snapshot made by snapshot()
+        restoreRNG: bool
+            whether to put the global RNGs back to their state at the time of the
+            snapshot. restoring them makes the run continue exactly as the original;
+            leave them alone to fork a variant with different randomness
+
+        Returns
+        -------
+        :object
+            the restored simulation
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("not a simulation checkpoint")
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a simulation checkpoint")
+    if version != VERSION:
+        raise ValueError("checkpoint version " + str(version) + " does not match this code's version "
+                         + str(VERSION) + "; it was saved by a different version of the simulation classes")
+    state = pickle.loads(zlib.decompress(data[HEADER.size:]))
+    if restoreRNG:
+        np.random.set_state(state['numpy'])
+        random.setstate(state['random'])
+    return state['simulation']
+
+def fork(simulation):
+    # independent copy of a simulation, e.g. a warmed-up run to try variants on
+    # the copy gets copies of the original's Generators, so it replays the same randomness
+    # until its parameters or generators are changed. the global RNGs are left alone
+    return restore(snapshot(simulation), restoreRNG=False)
+
+def save(simulation, path):
+    # writes a snapshot to path. the file is replaced in one step, so an interrupted
+    # save never leaves a broken checkpoint behind
+    data = snapshot(simulation)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+def load(path, restoreRNG=True):
+    # reads a snapshot written by save()
+    with open(path, 'rb') as f:
+        return restore(f.read(), restoreRNG)
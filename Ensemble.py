@@ -0,0 +1,325 @@
+# Ensemble simulation: many independent AODV trials stepped together
+# Every trial's state is stacked into arrays indexed by (trial, node, ...), so each timeslot
+# is one set of numpy operations over all trials. Finished trials are retired from the arrays.
+#
+# Only AODV is simulated. Simulation's OLSR and custom protocols have no ensemble version, so
+# comparisons between the protocols still need Simulation.
+#
+# The engine is meant for static swarms (mobile=False). 200 static Grid(15, r_rad=6, m_rad=0)
+# trials take 0.14 s against 0.88 s for looping AODVSimulation, 1000 take 0.8 s against 4.5 s.
+# With mobility, every trial's Grid.mutate still runs in Python one grid at a time and takes
+# nearly all of the time, so the ensemble is no faster than the loop (3.0 s against 2.9 s for
+# 200 trials with m_rad=3).
+#
+# Timeslots are synchronous: every transmitting node pulls its packet at the start of the
+# slot, so a packet received during a slot is forwarded from the next slot on. Simulation
+# handles nodes one at a time within a slot, so a packet can travel several hops in one slot
+# there. The ensemble's timeslot counts are therefore biased upwards: 13.1 against 12.3 on
+# 200 static swarms as above, and 39.8 against 32.3 with m_rad=3, where the longer runs also
+# see more mutations. Overhead agrees within 2%. Compare ensemble timeslot counts with each
+# other, not with Simulation's.
+
+from simulation import *
+
+import numpy as np
+
+RREQ = 0
+RREP = 1
+
+def reserve(array, size):
+    # array with room for at least size entries, keeping its contents. the capacity at least
+    # doubles whenever it grows, so appending n entries one batch at a time costs O(n) overall
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 64), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class EnsembleSimulation:
+
+    def __init__(self, grids, maxTimeslots=5000, timeout=100, retry=5, bufferLimit=10, rng=None, mobile=True):
+        # grids is a list of Grid (or ContinuousSwarm) objects, one per trial
+        # if mobile is False the grids are never mutated. static swarms (m_rad=0) don't move anyway,
+        # and Grid.mutate would spend most of the run finding that out
+        # rng is the numpy Generator for the sources, targets and transmissions. each grid
+        # keeps drawing its mobility from its own generator
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+        self.grids = list(grids)
+        self.numTrials = len(self.grids)
+        self.maxTimeslots = maxTimeslots # simulation gets cut off after this so we don't infinite loop
+        self.timeSlot = 0
+        self.__timeout = timeout # time before source node resends a discovery packets
+        self.__retry = retry # number of times node should try to re-transmit a packet
+        self.__bufferLimit = bufferLimit
+        self.__mobile = mobile
+
+        # trials can have different numbers of nodes: pad to the largest with isolated nodes
+        neighbors = [getNeighbors(g.getNeighborsDict()) for g in self.grids]
+        self.numNodes = np.array([len(nb) for nb in neighbors])
+        N = self.numNodes.max()
+        self.__N = N
+
+        # randomly choose the source and destination nodes of every trial
+        self.source = np.zeros(self.numTrials, dtype=int)
+        self.target = np.zeros(self.numTrials, dtype=int)
+        for b in range(self.numTrials):
+            choice = self.rng.choice(self.numNodes[b], 2, replace=False)
+            self.source[b] = choice[0]
+            self.target[b] = choice[1]
+
+        # state of the active trials, one row per trial
+        self.__trials = np.arange(self.numTrials) # which trial each row is
+        self.__adjacency = np.zeros((self.numTrials, N, N), dtype=bool)
+        for b in range(self.numTrials):
+            self.setAdjacency(b, neighbors[b])
+        self.__queues = np.full((self.numTrials, N, bufferLimit), -1) # packet ids, oldest first
+        self.__queueLengths = np.zeros((self.numTrials, N), dtype=int)
+        self.__received = np.full((self.numTrials, N), -1) # timestamp of the newest RREQ each node has received
+        self.__destinationReached = np.zeros(self.numTrials, dtype=bool)
+        self.__lastTimeout = np.zeros(self.numTrials, dtype=int)
+
+        # packets of all trials. a packet is a type, a timestamp, a retransmit count and a
+        # path link. links form a tree: a link is a node and the link before it, so a RREQ's
+        # path is the chain of links ending at the RREQ's holder, and a reply's link is the
+        # next hop on its way back to the source
+        # the arrays are buffers (see reserve): only the first __numPackets and __numLinks entries are used
+        self.__numPackets = 0
+        self.__numLinks = 0
+        self.__packetTypes = np.zeros(0, dtype=int)
+        self.__packetStamps = np.zeros(0, dtype=int)
+        self.__packetRetransmits = np.zeros(0, dtype=int)
+        self.__packetLinks = np.zeros(0, dtype=int)
+        self.__linkNodes = np.zeros(0, dtype=int)
+        self.__linkParents = np.zeros(0, dtype=int)
+
+        # measurement variables for comparisons, one entry per trial
+        self.__totalTimeslots = np.zeros(self.numTrials, dtype=int)
+        self.__totalOverhead = np.zeros(self.numTrials, dtype=int)
+        self.__queueLength = np.zeros(self.numTrials)
+
+        self.beginDiscover(np.arange(self.numTrials), 0)
+
+        while len(self.__trials) and (self.timeSlot < self.maxTimeslots):
+            self.step()
+            self.mutate()
+
+    def end(self):
+        # return results: [timeslots, overhead, queue usage] for every trial, like the AODV part of Simulation.end
+        # trials cut off at maxTimeslots report [None, None, None]
+        # timeslots are counted with synchronous slots (see the top of this file): they are higher
+        # than AODVSimulation's on the same swarms, so compare them only with other ensemble runs.
+        # overhead and queue usage are comparable with Simulation's
+        results = []
+        unfinished = set(self.__trials.tolist())
+        for b in range(self.numTrials):
+            if b in unfinished:
+                results.append([None, None, None])
+                continue
+            timeslots = max(1, self.__totalTimeslots[b])
+            results.append([int(self.__totalTimeslots[b]), int(self.__totalOverhead[b]),
+                            ((self.__queueLength[b] / timeslots) / self.__bufferLimit) * 100])
+        return results
+
+    def setAdjacency(self, row, neighbors):
+        # fills one trial's adjacency matrix from its neighbors dictionary
+        self.__adjacency[row] = False
+        for node, nl in neighbors.items():
+            self.__adjacency[row, node, nl] = True
+
+    def refreshAdjacency(self, row, grid, movement):
+        # updates one trial's adjacency matrix after its grid mutated
+        # a swarm with CSR neighbors (ContinuousSwarm) is refilled in one go. a Grid only
+        # rescans the rows and columns of the nodes that moved; movement is what mutate() returned
+        if hasattr(grid, 'getNeighborsCSR'):
+            indptr, indices = grid.getNeighborsCSR()
+            self.__adjacency[row] = False
+            self.__adjacency[row, np.repeat(np.arange(len(indptr) - 1), np.diff(indptr)), indices] = True
+            return
+        moved = [node for node, m in movement.items() if m]
+        if not moved:
+            return
+        self.__adjacency[row, moved, :] = False
+        self.__adjacency[row, :, moved] = False
+        moved = set(moved)
+        for d, nl in grid.getNeighborsDict().items():
+            if d.getID() in moved:
+                nodes = [n.getID() for n in nl]
+                self.__adjacency[row, d.getID(), nodes] = True
+                self.__adjacency[row, nodes, d.getID()] = True
+
+    def mutate(self):
+        # mutates every active trial's grid every 10 time slots
+        if self.__mobile and self.timeSlot % 10 == 0 and self.timeSlot != 0:
+            for row, b in enumerate(self.__trials):
+                self.refreshAdjacency(row, self.grids[b], self.grids[b].mutate())
+        self.timeSlot += 1
+
+    def newLinks(self, nodes, parents):
+        start = self.__numLinks
+        self.__numLinks += len(nodes)
+        self.__linkNodes = reserve(self.__linkNodes, self.__numLinks)
+        self.__linkParents = reserve(self.__linkParents, self.__numLinks)
+        self.__linkNodes[start:self.__numLinks] = nodes
+        self.__linkParents[start:self.__numLinks] = parents
+        return np.arange(start, self.__numLinks)
+
+    def newPackets(self, types, stamps, links):
+        start = self.__numPackets
+        self.__numPackets += len(types)
+        self.__packetTypes = reserve(self.__packetTypes, self.__numPackets)
+        self.__packetStamps = reserve(self.__packetStamps, self.__numPackets)
+        self.__packetRetransmits = reserve(self.__packetRetransmits, self.__numPackets)
+        self.__packetLinks = reserve(self.__packetLinks, self.__numPackets)
+        self.__packetTypes[start:self.__numPackets] = types
+        self.__packetStamps[start:self.__numPackets] = stamps
+        self.__packetRetransmits[start:self.__numPackets] = 0
+        self.__packetLinks[start:self.__numPackets] = links
+        return np.arange(start, self.__numPackets)
+
+    def beginDiscover(self, rows, timeSlot):
+        # put route request packets into the sources' queues of the given rows
+        if not len(rows):
+            return
+        sources = self.source[self.__trials[rows]]
+        links = self.newLinks(sources, np.full(len(rows), -1))
+        packets = self.newPackets(np.full(len(rows), RREQ), np.full(len(rows), timeSlot), links)
+        self.pushToBack(rows, sources, packets)
+        self.__received[rows, sources] = timeSlot
+        self.__lastTimeout[rows] = timeSlot
+
+    def pushToBack(self, rows, nodes, packets):
+        # appends packets to the back of the (row, node) queues, in order
+        # like a deque with maxlen, a full queue drops packets from the front
+        if not len(packets):
+            return
+        keys = rows * self.__N + nodes
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        rows = rows[order]
+        nodes = nodes[order]
+        packets = packets[order]
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        ranks = np.arange(len(keys)) - np.repeat(first, counts) # position of each packet within its queue's pushes
+        qr = rows[first]
+        qn = nodes[first]
+        lengths = self.__queueLengths[qr, qn]
+        total = lengths + counts
+        drop = np.maximum(0, total - self.__bufferLimit) # how many packets fall off the front
+
+        full = drop > 0
+        if full.any():
+            limit = self.__bufferLimit
+            index = np.arange(limit)[None,:] + drop[full][:,None]
+            kept = np.take_along_axis(self.__queues[qr[full], qn[full]], np.minimum(index, limit - 1), axis=1)
+            self.__queues[qr[full], qn[full]] = np.where(index < limit, kept, -1)
+
+        positions = np.repeat(lengths - drop, counts) + ranks
+        keep = positions >= 0
+        self.__queues[rows[keep], nodes[keep], positions[keep]] = packets[keep]
+        self.__queueLengths[qr, qn] = np.minimum(total, self.__bufferLimit)
+
+    def pushToFront(self, rows, nodes, packets):
+        # puts packets at the front of the (row, node) queues. each queue gets at most one packet
+        if not len(packets):
+            return
+        self.__queues[rows, nodes, 1:] = self.__queues[rows, nodes, :-1]
+        self.__queues[rows, nodes, 0] = packets
+        self.__queueLengths[rows, nodes] = np.minimum(self.__queueLengths[rows, nodes] + 1, self.__bufferLimit)
+
+    def step(self):
+        timeSlot = self.timeSlot
+        numRows = len(self.__trials)
+        trials = self.__trials
+
+        # if it has been longer than timeout time slots, put a RREQ packet back in the source node's queue
+        self.beginDiscover(np.flatnonzero(timeSlot - self.__lastTimeout > self.__timeout), timeSlot)
+
+        # record queue length
+        self.__queueLength[trials] += self.__queueLengths.sum(axis=1) / self.numNodes[trials]
+
+        # choose nodes that will successfully transmit in this timeslot, and pull their packets
+        p = get_p(None, None)
+        sending = (self.rng.random((numRows, self.__N)) < p) & (self.__queueLengths > 0)
+        rows, nodes = np.nonzero(sending)
+        last = self.__queueLengths[rows, nodes] - 1
+        packets = self.__queues[rows, nodes, last]
+        self.__queues[rows, nodes, last] = -1
+        self.__queueLengths[rows, nodes] = last
+        isRequest = self.__packetTypes[packets] == RREQ
+
+        frontRows, frontNodes, frontPackets = [], [], [] # packets going back to the front of their queue
+        backRows, backNodes, backPackets = [], [], [] # packets sent to the back of a neighbor's queue
+
+        # route requests: one transmission to every neighbor
+        senders = np.full((numRows, self.__N), -1)
+        senders[rows[isRequest], nodes[isRequest]] = packets[isRequest]
+        pr, ps, pn = np.nonzero((senders >= 0)[:,:,None] & self.__adjacency)
+        self.__totalOverhead[trials] += np.bincount(pr, minlength=numRows)
+        requests = senders[pr, ps]
+        stamps = self.__packetStamps[requests]
+
+        hits = np.flatnonzero((pn == self.target[trials[pr]]) & ~self.__destinationReached[pr])
+        _, first = np.unique(pr[hits], return_index=True)
+        replies = hits[first] # first pair of every trial to reach the target
+        self.__destinationReached[pr[replies]] = True
+        candidates = np.ones(len(pn), dtype=bool)
+        candidates[replies] = False
+
+        keys = pr * self.__N + pn
+        received = self.__received.reshape(-1)
+        accepted = newestOffers(keys, stamps, candidates, received)
+        np.maximum.at(received, keys[accepted], stamps[accepted])
+        links = self.newLinks(pn[accepted], self.__packetLinks[requests[accepted]])
+        forwarded = np.zeros(len(pn), dtype=int)
+        forwarded[accepted] = self.newPackets(np.full(len(links), RREQ), stamps[accepted], links)
+        # the reply retraces the request's path, starting from the node that reached the target
+        forwarded[replies] = self.newPackets(np.full(len(replies), RREP), np.full(len(replies), timeSlot), self.__packetLinks[requests[replies]])
+        outgoing = np.flatnonzero(accepted | np.isin(np.arange(len(pn)), replies))
+        backRows.append(pr[outgoing])
+        backNodes.append(pn[outgoing])
+        backPackets.append(forwarded[outgoing])
+
+        isolated = isRequest & ~self.__adjacency[rows, nodes].any(axis=1) # no neighbors, so nothing was sent
+        frontRows.append(rows[isolated])
+        frontNodes.append(nodes[isolated])
+        frontPackets.append(packets[isolated])
+
+        # route replies: done once the source is a neighbor, otherwise forward to the next node on the path
+        rr = rows[~isRequest]
+        rn = nodes[~isRequest]
+        rp = packets[~isRequest]
+        nextHops = self.__linkNodes[self.__packetLinks[rp]]
+        done = self.__adjacency[rr, rn, self.source[trials[rr]]]
+        forward = ~done & self.__adjacency[rr, rn, nextHops] & (self.__packetRetransmits[rp] <= self.__retry)
+        self.__packetLinks[rp[forward]] = self.__linkParents[self.__packetLinks[rp[forward]]]
+        self.__totalOverhead[trials] += np.bincount(rr[forward], minlength=numRows)
+        backRows.append(rr[forward])
+        backNodes.append(nextHops[forward])
+        backPackets.append(rp[forward])
+        stuck = ~done & ~forward
+        self.__packetRetransmits[rp[stuck]] += 1
+        frontRows.append(rr[stuck])
+        frontNodes.append(rn[stuck])
+        frontPackets.append(rp[stuck])
+
+        self.pushToFront(np.concatenate(frontRows), np.concatenate(frontNodes), np.concatenate(frontPackets))
+        self.pushToBack(np.concatenate(backRows), np.concatenate(backNodes), np.concatenate(backPackets))
+
+        # retire finished trials
+        finished = np.unique(rr[done])
+        if len(finished):
+            self.__totalTimeslots[trials[finished]] = timeSlot
+            keep = np.ones(numRows, dtype=bool)
+            keep[finished] = False
+            self.__trials = self.__trials[keep]
+            self.__adjacency = self.__adjacency[keep]
+            self.__queues = self.__queues[keep]
+            self.__queueLengths = self.__queueLengths[keep]
+            self.__received = self.__received[keep]
+            self.__destinationReached = self.__destinationReached[keep]
+            self.__lastTimeout = self.__lastTimeout[keep]
+
+    def getActiveTrials(self):
+        return self.__trials
@@ -7,49 +7,130 @@
 from Point import *
 from Node import *
 
-import random, math
+import math
+import heapq
 import numpy as np
 from collections import deque
 
+# Node and Point are exported too, for code that gets them through 'from Grid import *'
+__all__ = ['Grid', 'Node', 'Point']
+
 class Grid:
     
     # arbitrary definition of Rx/Tx reachable radius
     __radioRadius = 5
     __mobilityRadius = 4
     
-    def __init__(self, size, r_rad=5, m_rad=4, seed=None):
+    def __init__(self, size, r_rad=5, m_rad=4, seed=None, pop_density=1/5, num_nodes=None, sparse=False, rng=None, max_attempts=100, connected=True):
         # creates a square grid of dimensions size x size
         # grid is a 2D numpy array
         # unpopulated points in the Grid denoted by 0
+        # if sparse is True, the grid is a dictionary of occupied cells
+        # keyed by (x, y) instead, so very large grids never allocate size x size
+        # num_nodes overrides pop_density when given
+        # rng is the numpy Generator used for placement and mobility. if it's None,
+        # one is created from seed
+        # the nodes are placed again until they form a single swarm, at most max_attempts
+        # times (ValueError after that). connected=False keeps the first placement as it is,
+        # for swarms too sparse to ever be connected
+        
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        self.__rng = rng
         
-        pop_density = 1/5
+        if num_nodes is None:
+            num_nodes = int(size*size*pop_density)
         
         self.__gridsize = size
         self.__radioRadius = r_rad
         self.__mobilityRadius = m_rad
-        self.__grid = np.zeros((size,size), dtype=Node)
+        self.__sparse = sparse
+        self.__grid = self.emptyGrid()
         self.__devices = []
         self.__idCount = 0
+        self.__freeIDs = [] # heap of the IDs of removed devices, reused by devices that join later
         self.__allNeighbors = {}
+        self.__singleSwarm = None # cached result of isSingleSwarm, None if unknown
+        self.__version = 0 # counts changes to the topology
         
-        self.populate(int(size*size*pop_density), seed) # guarantees that 1/5 of grid will be occupied
+        self.populate(num_nodes) # guarantees that pop_density of grid will be occupied
         self.findNeighbors()
         
-        while (not self.isSingleSwarm()):
-            seed += 100
+        attempts = 1
+        while connected and (not self.isSingleSwarm()):
+            if attempts >= max_attempts:
+                raise ValueError("no connected placement of " + str(num_nodes) + " nodes on a " + str(size) + "x" + str(size)
+                                 + " grid with radio radius " + str(r_rad) + " after " + str(attempts) + " attempts;"
+                                 + " raise pop_density or r_rad, or pass connected=False")
+            attempts += 1
             self.__gridsize = size
             self.__radioRadius = r_rad
             self.__mobilityRadius = m_rad
-            self.__grid = np.zeros((size,size), dtype=Node)
+            self.__grid = self.emptyGrid()
             self.__devices = []
             self.__idCount = 0
             self.__allNeighbors = {}
             
-            self.populate(int(size*size*pop_density), seed) # guarantees that 1/5 of grid will be occupied
+            self.populate(num_nodes) # guarantees that pop_density of grid will be occupied
             self.findNeighbors()
         
         self.__sparsity = self.measureSparsity()
         
+    # returns an empty grid: a dense numpy array, or an empty dictionary in sparse mode
+    # sparse mode also resets the buckets used for neighbor search, dense mode
+    # resets the boolean occupancy array used for neighbor search
+    def emptyGrid(self):
+        if self.__sparse:
+            self.__buckets = {}
+            return {}
+        self.__occupied = np.zeros((self.__gridsize,self.__gridsize), dtype=bool)
+        return np.zeros((self.__gridsize,self.__gridsize), dtype=Node)
+    
+    # returns the Node at (x, y), or 0 if the cell is unpopulated
+    def getCell(self, x, y):
+        if self.__sparse:
+            return self.__grid.get((x,y), 0)
+        return self.__grid[x,y]
+    
+    # puts node at (x, y). passing 0 empties the cell
+    def setCell(self, x, y, node):
+        if self.__sparse:
+            old = self.__grid.pop((x,y), None)
+            if old is not None:
+                self.__buckets[self.bucketOf(x,y)].discard(old)
+            if type(node) == Node:
+                self.__grid[(x,y)] = node
+                self.__buckets.setdefault(self.bucketOf(x,y), set()).add(node)
+        else:
+            self.__grid[x,y] = node
+            self.__occupied[x,y] = type(node) == Node
+    
+    # sparse mode indexes occupied cells in square buckets as wide as the radio radius,
+    # so every neighbor of a node lies in the 3x3 buckets around it
+    def bucketOf(self, x, y):
+        width = max(1, int(math.ceil(self.__radioRadius)))
+        return (x // width, y // width)
+    
+    def isSparse(self):
+        return self.__sparse
+    
+    def getSize(self):
+        return self.__gridsize
+    
+    def getDevices(self):
+        return self.__devices
+    
+    def getRNG(self):
+        return self.__rng
+    
+    # IDs are recycled, so every device's ID is below this number
+    def getNumIDs(self):
+        return self.__idCount
+    
+    # increases every time a device moves, joins or leaves, so results derived from
+    # the topology can be cached until it changes
+    def getVersion(self):
+        return self.__version
         
     # defined as average number of immediately adjacent neighbors that each node
     # in the swarm can communicate with
@@ -89,28 +170,43 @@ class Grid:
                 lry = (self.__gridsize - 1)
             return [ulx, uly, lrx, lry]
         
+        # neighbors of a single device, by scanning the cells within the radio radius
+        # the window is scanned with numpy; np.nonzero keeps the x-major, y-minor cell order
+        def scanCells(d):
+            neighbors = []
+            ulx, uly, lrx, lry = getRadiusCorners(d.getCoordinate())
+            window = self.__grid[ulx:lrx+1, uly:lry+1]
+            xs, ys = np.nonzero(self.__occupied[ulx:lrx+1, uly:lry+1])
+            x = d.getCoordinate().getX() - ulx
+            y = d.getCoordinate().getY() - uly
+            inRange = (xs - x)**2 + (ys - y)**2 <= self.__radioRadius**2
+            for n in window[xs[inRange], ys[inRange]]:
+                if n != d:
+                    neighbors.append(n)
+            return neighbors
+        
+        # neighbors of a single device, by scanning the 3x3 buckets around it (sparse mode)
+        # sorted by (x, y) so the ordering matches the dense cell scan
+        def scanBuckets(d):
+            neighbors = []
+            bx, by = self.bucketOf(d.getCoordinate().getX(), d.getCoordinate().getY())
+            for i in range(bx-1, bx+2):
+                for j in range(by-1, by+2):
+                    for n in self.__buckets.get((i,j), ()):
+                        if (n != d) and (n.distanceToNode(d) <= self.__radioRadius):
+                            neighbors.append(n)
+            neighbors.sort(key=lambda n: (n.getCoordinate().getX(), n.getCoordinate().getY()))
+            return neighbors
+        
+        scan = scanBuckets if self.__sparse else scanCells
+        
         if singleDevice == None:
             for d in self.__devices:
-                neighbors = []
-                ulx, uly, lrx, lry = getRadiusCorners(d.getCoordinate())
-                for x in range(ulx,lrx+1):
-                    for y in range(uly,lry+1):
-                        n = self.__grid[x,y]
-                        if (type(n) == Node) and (n != d) and (n.distanceToNode(d) <= self.__radioRadius):
-                            neighbors.append(n)
-                            
-                self.__allNeighbors[d] = neighbors
+                self.__allNeighbors[d] = scan(d)
+            self.__singleSwarm = None
+            self.__version += 1
         else:
-            d = singleDevice
-            neighbors = []
-            ulx, uly, lrx, lry = getRadiusCorners(d.getCoordinate())
-            for x in range(ulx,lrx+1):
-                for y in range(uly,lry+1):
-                    n = self.__grid[x,y]
-                    if (type(n) == Node) and (n != d) and (n.distanceToNode(d) <= self.__radioRadius):
-                        neighbors.append(n)
-                        
-            self.__allNeighbors[d] = neighbors
+            self.__allNeighbors[singleDevice] = scan(singleDevice)
                         
         return None
     
@@ -118,17 +214,17 @@ class Grid:
         return self.__allNeighbors
         
     def getNode(self, x, y):
-        if type(self.__grid[x,y]) != Node:
+        if type(self.getCell(x,y)) != Node:
             print("No Node found at " + str(Point(x, y)))
             return False
         else:
-            return self.__grid[x,y]
+            return self.getCell(x,y)
     
     # mutates the entire swarm
     # 1. iterate through each device in Grid
     # 2. get rectangle surrounding device defined by mobility radius
     # 3. choose a place to move to randomly.
-    # 4. make sure swarm is still contiguous. if not, redo #3
+    # 4. make sure swarm is still contiguous. if not, redo #3 (only if it was contiguous to begin with)
     # 5. if there are no possible places to move, pop device from fringe and re-add to back
     # 6. for any device, give up trying to move after 3 tries
     def mutate(self):
@@ -152,6 +248,8 @@ class Grid:
             return [ulx, uly, lrx, lry]
         fringe = deque([])
         m = {}
+        # a swarm built with connected=False may start out split; its moves are not checked
+        keepConnected = self.isSingleSwarm()
         # add all devices to fringe.
         for d in self.__devices:
             fringe.append([d, 0])
@@ -166,20 +264,22 @@ class Grid:
             oldX = d.getCoordinate().getX()
             oldY = d.getCoordinate().getY()
             ulx, uly, lrx, lry = getRadiusCorners(d.getCoordinate())
-            randX = random.randint(ulx,lrx)
-            randY = random.randint(uly,lry)
+            randX = int(self.__rng.integers(ulx,lrx+1))
+            randY = int(self.__rng.integers(uly,lry+1))
             while (np.sqrt((oldX-randX)**2 + (oldY-randY)**2) > self.__mobilityRadius):
-                randX = random.randint(ulx,lrx)
-                randY = random.randint(uly,lry)
-            n = self.__grid[randX,randY]
+                randX = int(self.__rng.integers(ulx,lrx+1))
+                randY = int(self.__rng.integers(uly,lry+1))
+            n = self.getCell(randX,randY)
             if n != 0:
                 fringe.append([d,i+1])
             else:
                 m[d.getID()] = 1
+                connected = self.__singleSwarm
                 self.moveDevice(oldX, oldY, randX, randY)
-                if (not self.isSingleSwarm()):
+                if keepConnected and (not self.isSingleSwarm()):
                     m[d.getID()] = 0
                     self.moveDevice(randX, randY, oldX, oldY)
+                    self.__singleSwarm = connected # moving back restores the old topology
                     fringe.append([d,i+1])
         
         return m
@@ -192,28 +292,53 @@ class Grid:
     # 5. set current grid location to 0
     # 6. update node neighbors and new neighbors' neighbors
     # 7. update old neighbors' neighbors
+    # only the moving node is rescanned: it is removed from its old neighbors' lists
+    # and inserted into its new neighbors' lists, which stay sorted by (x, y)
     def moveDevice(self, currX, currY, newX, newY):
-        if type(self.__grid[currX, currY]) != Node:
+        if type(self.getCell(currX, currY)) != Node:
             print("No Node found at " + str(Point(currX, currY)))
             assert False
-        elif type(self.__grid[newX, newY]) == Node:
+        elif type(self.getCell(newX, newY)) == Node:
             print(str(Point(newX, newY)) + " is not empty")
             assert False
         else:
-            movingNode = self.__grid[currX, currY]
+            movingNode = self.getCell(currX, currY)
             oldNeighbors = self.__allNeighbors[movingNode]
-            self.__grid[currX, currY] = 0
+            self.setCell(currX, currY, 0)
             movingNode.setCoordinate(Point(newX,newY))
-            self.__grid[newX, newY] = movingNode
+            self.setCell(newX, newY, movingNode)
             self.findNeighbors(movingNode)
-            for n in self.__allNeighbors[movingNode]:
-                self.findNeighbors(n)
             for on in oldNeighbors:
-                self.findNeighbors(on)
+                self.__allNeighbors[on].remove(movingNode)
+            for n in self.__allNeighbors[movingNode]:
+                self.insertNeighbor(n, movingNode)
             
+            # a connected swarm stays connected if the node can still reach all of its old
+            # neighbors: every other node reached the node through one of them
+            if self.__singleSwarm and len(self.__devices) > 1:
+                self.__singleSwarm = len(self.__allNeighbors[movingNode]) > 0 and self.reaches(movingNode, oldNeighbors)
+            else:
+                self.__singleSwarm = None
+            self.__version += 1
             return True
     
-    # adds a new Device to Grid
+    # inserts newNeighbor into node's neighbor list, keeping the list sorted by (x, y)
+    def insertNeighbor(self, node, newNeighbor):
+        neighbors = self.__allNeighbors[node]
+        key = (newNeighbor.getCoordinate().getX(), newNeighbor.getCoordinate().getY())
+        lo, hi = 0, len(neighbors) # binary search for the first neighbor at or after key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            c = neighbors[mid].getCoordinate()
+            if (c.getX(), c.getY()) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        neighbors.insert(lo, newNeighbor)
+    
+    # adds a new Device to Grid at its coordinate
+    # the device gets the smallest free ID: one left behind by a removed device, or a new one
+    # only the new device is scanned; it is inserted into its neighbors' sorted lists
     def addDevice(self, newNode):
         if (newNode in self.__devices):
             print("Node already in grid")
@@ -221,65 +346,141 @@ class Grid:
             
         newX = newNode.getCoordinate().getX()
         newY = newNode.getCoordinate().getY()
-        if type(self.__grid[newX, newY]) == Node:
+        if type(self.getCell(newX, newY)) == Node:
             print("Coordinate already occupied!")
             return False
         else:
-            newNode.setID(self.__idCount)
-            self.__idCount += 1
-            self.__devices.append(Node)
-            self.__grid[newX, newY] = newNode
+            if self.__freeIDs:
+                newNode.setID(heapq.heappop(self.__freeIDs))
+            else:
+                newNode.setID(self.__idCount)
+                self.__idCount += 1
+            self.__devices.append(newNode)
+            self.setCell(newX, newY, newNode)
             self.findNeighbors(newNode)
             # need to also update the neighbors list of all new neighbors
             for n in self.__allNeighbors[newNode]:
-                self.findNeighbors(n)
+                self.insertNeighbor(n, newNode)
+            
+            # joining a connected swarm keeps it connected if the device has a neighbor
+            if self.__singleSwarm:
+                self.__singleSwarm = len(self.__allNeighbors[newNode]) > 0
+            else:
+                self.__singleSwarm = None
+            self.__version += 1
             return True
+    
+    # removes a Device from Grid. its ID is freed for devices that join later
+    def removeDevice(self, node):
+        if (node not in self.__allNeighbors):
+            print("Node not in grid")
+            return False
+        
+        oldNeighbors = self.__allNeighbors.pop(node)
+        for on in oldNeighbors:
+            self.__allNeighbors[on].remove(node)
+        self.setCell(node.getCoordinate().getX(), node.getCoordinate().getY(), 0)
+        self.__devices.remove(node)
+        heapq.heappush(self.__freeIDs, node.getID())
         
+        # a connected swarm stays connected if the old neighbors can still reach each other
+        if self.__singleSwarm and len(oldNeighbors) > 1:
+            self.__singleSwarm = self.reaches(oldNeighbors[0], oldNeighbors[1:])
+        elif not self.__singleSwarm or not self.__devices:
+            self.__singleSwarm = None
+        self.__version += 1
+        return True
+    
+    # adds a device at each of the given Points. returns the new Nodes that joined
+    def joinDevices(self, points):
+        joined = []
+        for p in points:
+            n = Node(None, p)
+            if self.addDevice(n):
+                joined.append(n)
+        return joined
     
+    # removes each of the given Nodes. returns the IDs that were freed
+    def leaveDevices(self, nodes):
+        return [n.getID() for n in list(nodes) if self.removeDevice(n)]
+    
+    # node churn that keeps the swarm contiguous
+    # numLeave random devices leave, skipping any whose departure would split the swarm
+    # and any whose ID is in keep. then numJoin devices join, each on a random empty cell
+    # within radio range of a random device
+    # returns (IDs that left, IDs that joined). joining devices reuse the freed IDs first
+    def churn(self, numLeave, numJoin, keep=()):
+        keep = set(keep)
+        left = []
+        candidates = [d for d in self.__devices if d.getID() not in keep]
+        for i in self.__rng.permutation(len(candidates)).tolist():
+            if len(left) >= numLeave or len(self.__devices) <= 2:
+                break
+            d = candidates[i]
+            neighbors = self.__allNeighbors[d]
+            if len(neighbors) > 1 and not self.reaches(neighbors[0], neighbors[1:], skip=d):
+                continue
+            self.removeDevice(d)
+            left.append(d.getID())
+        
+        joined = []
+        r = int(self.__radioRadius)
+        for _ in range(numJoin):
+            for attempt in range(100): # give up on this device if the swarm has no room left
+                anchor = self.__devices[int(self.__rng.integers(len(self.__devices)))].getCoordinate()
+                x = anchor.getX() + int(self.__rng.integers(-r, r+1))
+                y = anchor.getY() + int(self.__rng.integers(-r, r+1))
+                inRange = (x - anchor.getX())**2 + (y - anchor.getY())**2 <= self.__radioRadius**2
+                if inRange and (0 <= x < self.__gridsize) and (0 <= y < self.__gridsize) and self.getCell(x,y) == 0:
+                    n = Node(None, Point(x,y))
+                    self.addDevice(n)
+                    joined.append(n.getID())
+                    break
+        return left, joined
+    
+    # returns the dense numpy grid, or the dictionary of occupied cells in sparse mode
     def getGrid(self):
         return self.__grid
     
     # populates the grid with a swarm of size swarm_size
-    def populate(self, swarm_size, seed):
-        randomCoordinates = self.getRandomCoordinates(swarm_size, seed)
+    def populate(self, swarm_size):
+        randomCoordinates = self.getRandomCoordinates(swarm_size)
         
         assert len(randomCoordinates) == swarm_size # sanity check
         
         for i in range(swarm_size):
             c = randomCoordinates.pop()
             n = Node(i, c)
-            self.__grid[c.getX(), c.getY()] = n
+            self.setCell(c.getX(), c.getY(), n)
             self.__devices.append(n)
             self.__idCount += 1
         
         return None
         
     # returns a list of n unique Points
-    def getRandomCoordinates(self, n, seed):
+    # coordinates are drawn in batches; repeats are thrown away and redrawn in the next batch
+    def getRandomCoordinates(self, n):
         points = []
+        taken = set() # (x, y) pairs already chosen, for constant time repeat checks
         
-		# seed RNG seed
-        random.seed(seed)
-        
-        for _ in range(n):
-            x = random.randrange(self.__gridsize)
-            y = random.randrange(self.__gridsize)
-            p = Point(x,y)
-            
-            # used to prevent repeats
-            while(p in points):
-                x = random.randrange(self.__gridsize)
-                y = random.randrange(self.__gridsize)
-                p = Point(x,y)
-            
-            points.append(p)
+        while len(points) < n:
+            xs = self.__rng.integers(self.__gridsize, size=n-len(points))
+            ys = self.__rng.integers(self.__gridsize, size=n-len(points))
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                # used to prevent repeats
+                if (x,y) not in taken:
+                    taken.add((x,y))
+                    points.append(Point(x,y))
             
         return points
     
     # determines if all devices in grid are part of a single
     # contiguous swarm
+    # the answer is cached; moves, joins and leaves keep it up to date with local searches
     def isSingleSwarm(self):
-        swarm = []
+        if self.__singleSwarm is not None:
+            return self.__singleSwarm
+        swarm = set()
         fringe = []
         startNode = self.__devices[0]
         
@@ -288,34 +489,36 @@ class Grid:
         while(len(fringe) > 0):
             n = fringe.pop()
             if n not in swarm:
-                swarm.append(n)
+                swarm.add(n)
                 fringe.extend(self.__allNeighbors[n])
         
-        return len(swarm) == len(self.__devices)
+        self.__singleSwarm = len(swarm) == len(self.__devices)
+        return self.__singleSwarm
+    
+    # whether every node in targets can be reached from start, without passing through skip
+    # the search stops as soon as all targets are found, so it stays local when they are close
+    def reaches(self, start, targets, skip=None):
+        remaining = set(targets)
+        remaining.discard(start)
+        seen = {start, skip}
+        fringe = deque([start])
+        while remaining and fringe:
+            n = fringe.popleft()
+            for m in self.__allNeighbors[n]:
+                if m not in seen:
+                    seen.add(m)
+                    remaining.discard(m)
+                    fringe.append(m)
+        return not remaining
         
     def __str__(self):
-        numDevices = self.__idCount
-        zpcount = 0
-        blank = "-"
-        while(numDevices > 0):
-            blank += "-"
-            zpcount += 1
-            numDevices = int(numDevices / 10)
-            
-        render = ""
-        for x in range(self.__gridsize):
-            for y in range(self.__gridsize):
-                # x,y index ordering is reversed here to
-                # account for numpy matrix ordering
-                s = self.__grid[y,x]
-                if s == 0:
-                    render += blank
-                else:
-                    render += s.renderView(zpcount)
-                render += " "
-            render += "\n"
-            
-        return render
+        return self.render()
+    
+    # renders the window [ulx, lrx) x [uly, lry) of the grid, defaulting to the whole grid
+    # see Render.renderASCII
+    def render(self, ulx=0, uly=0, lrx=None, lry=None):
+        import Render # only loaded once something is rendered
+        return Render.renderASCII(self, ulx, uly, lrx, lry)
                 
                 
                 
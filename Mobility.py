@@ -0,0 +1,325 @@
+# Continuous-space mobility models
+# Positions are float arrays of shape (numNodes, 2) inside the square [0, size] x [0, size].
+# Like Grid, X increases from left to right and Y increases from top to bottom.
+# Every model moves all of its nodes in one vectorized step per epoch.
+# Every model draws from its own numpy Generator, passed in as rng.
+
+from Point import *
+from Node import *
+
+import numpy as np
+
+__all__ = ['radiusNeighbors', 'reflect', 'RandomWaypoint', 'GaussMarkov', 'ReferencePointGroup', 'ContinuousSwarm']
+
+def radiusNeighbors(positions, radius):
+    """
+        Find every pair of nodes within radius of each other using a bucket spatial index.
+
+        Parameters
+        ----------
+        positions: numpy array
+            (numNodes, 2) float array of node coordinates
+        radius: float
+            radio radius
+
+        Returns
+        -------
+        :tuple
+            (indptr, indices) in CSR layout: the neighbors of node i are
+            indices[indptr[i]:indptr[i+1]], sorted in increasing order
+    """
+    numNodes = len(positions)
+    if numNodes == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # buckets as wide as the radius, so all neighbors are in the surrounding 3x3 buckets
+    cells = np.floor(positions / radius).astype(np.int64) + 1 # shift so neighboring buckets are never negative
+    width = cells[:,1].max() + 2
+    keys = cells[:,0] * width + cells[:,1]
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+
+    sources = []
+    candidates = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            target = keys + dx * width + dy
+            lo = np.searchsorted(sortedKeys, target, side='left')
+            hi = np.searchsorted(sortedKeys, target, side='right')
+            counts = hi - lo
+            total = counts.sum()
+            if total == 0:
+                continue
+            # expand each [lo, hi) range into the positions it covers
+            starts = np.repeat(lo, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            sources.append(np.repeat(np.arange(numNodes), counts))
+            candidates.append(order[starts + offsets])
+
+    if not sources:
+        return np.zeros(numNodes + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    sources = np.concatenate(sources)
+    candidates = np.concatenate(candidates)
+
+    delta = positions[sources] - positions[candidates]
+    keep = (sources != candidates) & (np.hypot(delta[:,0], delta[:,1]) <= radius)
+    sources = sources[keep]
+    candidates = candidates[keep]
+
+    order = np.lexsort((candidates, sources))
+    indices = candidates[order]
+    indptr = np.zeros(numNodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=numNodes), out=indptr[1:])
+    return indptr, indices
+
+def reflect(positions, size):
+    """
+        Reflect coordinates that left the square [0, size] back inside it.
+
+        Parameters
+        ----------
+        positions: numpy array
+            float array of coordinates
+        size: float
+            side length of the square
+
+        Returns
+        -------
+        :tuple
+            (reflected positions, boolean array of the coordinates that were reflected)
+    """
+    low = positions < 0
+    high = positions > size
+    positions = np.where(low, -positions, positions)
+    positions = np.where(high, 2 * size - positions, positions)
+    return np.clip(positions, 0, size), low | high
+
+class RandomWaypoint:
+    # each node picks a random waypoint and speed, travels there in a straight line,
+    # pauses for a random number of epochs and then picks the next waypoint
+
+    def __init__(self, numNodes, size, minSpeed=0.5, maxSpeed=2.0, maxPause=5, positions=None, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+        self.__rng = rng
+        self.__numNodes = numNodes
+        self.__size = size
+        self.__minSpeed = minSpeed
+        self.__maxSpeed = maxSpeed
+        self.__maxPause = maxPause # pauses are drawn uniformly from [0, maxPause] epochs
+        if positions is None:
+            positions = rng.uniform(0, size, (numNodes, 2))
+        self.__positions = np.asarray(positions, dtype=float)
+        self.__waypoints = rng.uniform(0, size, (numNodes, 2))
+        self.__speeds = rng.uniform(minSpeed, maxSpeed, numNodes)
+        self.__pauses = np.zeros(numNodes)
+
+    def step(self, dt=1.0):
+        # moves every node by one epoch of length dt
+        moving = self.__pauses <= 0
+        self.__pauses = np.where(moving, 0, self.__pauses - dt)
+
+        delta = self.__waypoints - self.__positions
+        distance = np.hypot(delta[:,0], delta[:,1])
+        travel = self.__speeds * dt
+        arrived = moving & (distance <= travel)
+        en_route = moving & ~arrived
+
+        scale = np.where(en_route, travel / np.maximum(distance, 1e-12), 0)
+        self.__positions = self.__positions + delta * scale[:,None]
+        self.__positions[arrived] = self.__waypoints[arrived]
+
+        # nodes that reached their waypoint pause, then head for a new one
+        numArrived = int(arrived.sum())
+        if numArrived:
+            self.__pauses[arrived] = self.__rng.uniform(0, self.__maxPause, numArrived)
+            self.__waypoints[arrived] = self.__rng.uniform(0, self.__size, (numArrived, 2))
+            self.__speeds[arrived] = self.__rng.uniform(self.__minSpeed, self.__maxSpeed, numArrived)
+        return self.__positions
+
+    def getPositions(self):
+        return self.__positions
+
+    def getRNG(self):
+        return self.__rng
+
+    def getSize(self):
+        return self.__size
+
+class GaussMarkov:
+    # speed and direction are first-order autoregressive processes:
+    # s_t = alpha*s_{t-1} + (1-alpha)*meanSpeed + sqrt(1-alpha^2)*N(0, speedSigma)
+    # alpha = 0 is memoryless random movement, alpha = 1 is straight-line movement
+
+    def __init__(self, numNodes, size, alpha=0.75, meanSpeed=1.0, speedSigma=0.5, directionSigma=0.5, positions=None, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+        self.__rng = rng
+        self.__numNodes = numNodes
+        self.__size = size
+        self.__alpha = alpha
+        self.__meanSpeed = meanSpeed
+        self.__speedSigma = speedSigma
+        self.__directionSigma = directionSigma
+        if positions is None:
+            positions = rng.uniform(0, size, (numNodes, 2))
+        self.__positions = np.asarray(positions, dtype=float)
+        self.__speeds = np.full(numNodes, float(meanSpeed))
+        self.__directions = rng.uniform(0, 2 * np.pi, numNodes)
+        self.__meanDirections = self.__directions.copy()
+
+    def step(self, dt=1.0):
+        # moves every node by one epoch of length dt
+        a = self.__alpha
+        noise = np.sqrt(1 - a * a)
+        self.__speeds = np.abs(a * self.__speeds + (1 - a) * self.__meanSpeed
+                               + noise * self.__rng.normal(0, self.__speedSigma, self.__numNodes))
+        self.__directions = (a * self.__directions + (1 - a) * self.__meanDirections
+                             + noise * self.__rng.normal(0, self.__directionSigma, self.__numNodes))
+
+        velocity = np.stack((np.cos(self.__directions), np.sin(self.__directions)), axis=1) * (self.__speeds * dt)[:,None]
+        self.__positions, bounced = reflect(self.__positions + velocity, self.__size)
+
+        # nodes that bounced off an edge turn around so they don't stick to the border
+        bouncedX = bounced[:,0]
+        bouncedY = bounced[:,1]
+        self.__directions[bouncedX] = np.pi - self.__directions[bouncedX]
+        self.__directions[bouncedY] = -self.__directions[bouncedY]
+        self.__meanDirections[bouncedX] = np.pi - self.__meanDirections[bouncedX]
+        self.__meanDirections[bouncedY] = -self.__meanDirections[bouncedY]
+        return self.__positions
+
+    def getPositions(self):
+        return self.__positions
+
+    def getRNG(self):
+        return self.__rng
+
+    def getSize(self):
+        return self.__size
+
+class ReferencePointGroup:
+    # nodes are split into groups. each group's reference point follows a random waypoint
+    # path and every member wanders within groupRadius of its reference point
+
+    def __init__(self, numNodes, size, numGroups=4, groupRadius=5.0, memberSpeed=0.5, minSpeed=0.5, maxSpeed=2.0, maxPause=5, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+        self.__rng = rng
+        self.__numNodes = numNodes
+        self.__size = size
+        self.__groupRadius = groupRadius
+        self.__memberSpeed = memberSpeed # how far a member's offset can drift each epoch
+        self.__groups = np.arange(numNodes) % numGroups # group of each node
+        self.__centers = RandomWaypoint(numGroups, size, minSpeed, maxSpeed, maxPause, rng=rng)
+        self.__offsets = self.drawOffsets(numNodes, groupRadius)
+        self.__positions, _ = reflect(self.__centers.getPositions()[self.__groups] + self.__offsets, size)
+
+    # random offsets distributed uniformly over a disc of the given radius
+    def drawOffsets(self, n, radius):
+        r = radius * np.sqrt(self.__rng.uniform(0, 1, n))
+        theta = self.__rng.uniform(0, 2 * np.pi, n)
+        return np.stack((r * np.cos(theta), r * np.sin(theta)), axis=1)
+
+    def step(self, dt=1.0):
+        # moves every group reference point, then every member around it
+        centers = self.__centers.step(dt)
+        self.__offsets = self.__offsets + self.drawOffsets(self.__numNodes, self.__memberSpeed * dt)
+        # members that drifted too far are pulled back onto the edge of the group
+        distance = np.hypot(self.__offsets[:,0], self.__offsets[:,1])
+        scale = np.minimum(1, self.__groupRadius / np.maximum(distance, 1e-12))
+        self.__offsets = self.__offsets * scale[:,None]
+        self.__positions, _ = reflect(centers[self.__groups] + self.__offsets, self.__size)
+        return self.__positions
+
+    def getGroups(self):
+        return self.__groups
+
+    def getPositions(self):
+        return self.__positions
+
+    def getRNG(self):
+        return self.__rng
+
+    def getSize(self):
+        return self.__size
+
+class ContinuousSwarm:
+    # a swarm driven by a continuous mobility model
+    # offers the same interface as Grid that Simulation relies on, so it can be
+    # passed to Simulation in place of a Grid
+
+    def __init__(self, model, r_rad=5):
+        self.__model = model
+        self.__radioRadius = r_rad
+        positions = model.getPositions()
+        self.__devices = [Node(i, Point(positions[i,0], positions[i,1])) for i in range(len(positions))]
+        self.__indptr, self.__indices = radiusNeighbors(positions, r_rad)
+        self.__allNeighbors = None # built from the CSR arrays on request
+        self.__version = 0 # counts epochs, see Grid.getVersion
+
+    # advances the mobility model by one epoch and recomputes neighbors
+    # returns a dictionary of node ID to 1 if the node moved, 0 otherwise
+    def mutate(self, dt=1.0):
+        old = self.__model.getPositions().copy()
+        positions = self.__model.step(dt)
+        moved = np.any(positions != old, axis=1)
+        for d in self.__devices:
+            i = d.getID()
+            d.setCoordinate(Point(positions[i,0], positions[i,1]))
+        self.__indptr, self.__indices = radiusNeighbors(positions, self.__radioRadius)
+        self.__allNeighbors = None
+        self.__version += 1
+        return dict(zip(range(len(self.__devices)), moved.astype(int).tolist()))
+
+    # returns the neighbors of every node in CSR layout: (indptr, indices)
+    def getNeighborsCSR(self):
+        return self.__indptr, self.__indices
+
+    def getNeighborsDict(self):
+        if self.__allNeighbors is None:
+            self.__allNeighbors = {}
+            for d in self.__devices:
+                i = d.getID()
+                self.__allNeighbors[d] = [self.__devices[j] for j in self.__indices[self.__indptr[i]:self.__indptr[i+1]]]
+        return self.__allNeighbors
+
+    def measureSparsity(self):
+        return len(self.__indices) / len(self.__devices)
+
+    def getSparsity(self):
+        return self.measureSparsity()
+
+    # determines if all devices are part of a single contiguous swarm
+    # breadth first search, expanding the whole frontier at once
+    def isSingleSwarm(self):
+        numNodes = len(self.__devices)
+        seen = np.zeros(numNodes, dtype=bool)
+        seen[0] = True
+        frontier = np.array([0])
+        while len(frontier):
+            starts = self.__indptr[frontier]
+            counts = self.__indptr[frontier + 1] - starts
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            reached = np.unique(self.__indices[np.repeat(starts, counts) + offsets])
+            frontier = reached[~seen[reached]]
+            seen[frontier] = True
+        return bool(seen.all())
+
+    def getDevices(self):
+        return self.__devices
+
+    def getModel(self):
+        return self.__model
+
+    def getRNG(self):
+        return self.__model.getRNG()
+
+    def getPositions(self):
+        return self.__model.getPositions()
+
+    def getSize(self):
+        return self.__model.getSize()
+
+    def getVersion(self):
+        return self.__version
@@ -1,3 +1,5 @@
+__all__ = ['Node']
+
 class Node:
 	
     def __init__(self, id, coordinate):
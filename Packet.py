@@ -1,10 +1,15 @@
+import copy
+
+__all__ = ['Packet', 'RouteRequest', 'RouteReply', 'DataPacket', 'LinkState']
+
 class Packet:
     # super class for all packets
     
-    def __init__(self, time_stamp, source, destination):
+    def __init__(self, time_stamp, source, destination, flow=0):
         self.__time_stamp = time_stamp # when the packet originated
         self.__source = source # the source
         self.__destination = destination # the target
+        self.__flow = flow # the flow the packet belongs to
         self.__retransmits = 0
 
     def getTimeStamp(self):
@@ -19,6 +24,10 @@ class Packet:
         # get packet destination
         return self.__destination
     
+    def getFlow(self):
+        # get the flow the packet belongs to
+        return self.__flow
+    
     def retransmit(self):
         # when the packet gets sent back into a queue, increment the number of times it has been re-transmitted.
         # this happens when a reverse path gets broken by movement of the swarm
@@ -30,25 +39,39 @@ class Packet:
 class RouteRequest(Packet):
     # AODV route request packet 
     
-    def __init__(self, time_stamp, source, destination):
-        Packet.__init__(self, time_stamp, source, destination)
+    def __init__(self, time_stamp, source, destination, flow=0):
+        Packet.__init__(self, time_stamp, source, destination, flow)
         self.__type = 'RouteRequest'
-        self.__path = [] # path that the request has taken
+        # path that the request has taken, stored newest node first as nested (node, rest) pairs
+        # so copies of a flooded request share the common part of their paths
+        self.__path = None
 
     def getType(self):
         return self.__type
     
     def addToPath(self, node):
-        self.__path.append(node)
+        self.__path = (node, self.__path)
         
     def getPath(self):
-        return self.__path
+        path = []
+        link = self.__path
+        while link is not None:
+            path.append(link[0])
+            link = link[1]
+        return path[::-1]
+    
+    def forward(self, node):
+        # copy of this request that has been forwarded to node
+        # the path is shared with this request instead of copied
+        newPacket = copy.copy(self)
+        newPacket.addToPath(node)
+        return newPacket
 
 class RouteReply(Packet):
     # AODV route reply packet
     
-    def __init__(self, time_stamp, source, destination, path):
-        Packet.__init__(self, time_stamp, source, destination)
+    def __init__(self, time_stamp, source, destination, path, flow=0):
+        Packet.__init__(self, time_stamp, source, destination, flow)
         self.__type = 'RouteReply'
         self.__path = path # reverse path from target -> source
 
@@ -61,6 +84,23 @@ class RouteReply(Packet):
     def getPath(self):
         return self.__path
 
+class DataPacket(Packet):
+    # data packet sent along a discovered route
+    
+    def __init__(self, time_stamp, source, destination, path, flow=0):
+        Packet.__init__(self, time_stamp, source, destination, flow)
+        self.__type = 'Data'
+        self.__path = path # remaining hops to the target, next hop first
+
+    def getType(self):
+        return self.__type
+    
+    def setPath(self, path):
+        self.__path = path
+        
+    def getPath(self):
+        return self.__path
+
 class LinkState():
     # OLSR link state packet
     def __init__(self, time_stamp, source):
@@ -68,7 +108,7 @@ class LinkState():
         self.__timeStamp = time_stamp
         self.__source = source
         self.__retransmits = 0
-        self.__path = []
+        self.__path = None # newest node first, as nested (node, rest) pairs like RouteRequest
         
     def getSource(self):
         return self.__source
@@ -88,7 +128,18 @@ class LinkState():
         return self.__retransmits
     
     def addToPath(self, node):
-        self.__path.append(node)
+        self.__path = (node, self.__path)
         
     def getPath(self):
-        return self.__path
\ No newline at end of file
+        path = []
+        link = self.__path
+        while link is not None:
+            path.append(link[0])
+            link = link[1]
+        return path[::-1]
+    
+    def forward(self, node):
+        # copy of this link state that has been forwarded to node, sharing the path
+        newPacket = copy.copy(self)
+        newPacket.addToPath(node)
+        return newPacket
\ No newline at end of file
@@ -1,6 +1,8 @@
 import math
 import numpy as np
 
+__all__ = ['Point']
+
 class Point:
     
     def __init__(self, x, y):
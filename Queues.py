@@ -1,6 +1,8 @@
 from collections import deque
 import numpy as np
 
+__all__ = ['QueueHolder', 'PacketQueue']
+
 class QueueHolder:
     
     def __init__(self, numNodes):
@@ -18,6 +20,17 @@ class QueueHolder:
     def getQueue(self, node):
         # convert back to string
         return self.__queueHolder[node]
+    
+    def resetQueue(self, node):
+        # gives node an empty queue, e.g. when it leaves the swarm or a joining node reuses its ID
+        # node may be beyond the current nodes, in which case the holder grows
+        # returns the packets that were dropped
+        old = self.__queueHolder.get(node)
+        self.__queueHolder[node] = PacketQueue(node)
+        self.__numNodes = max(self.__numNodes, node + 1)
+        if old is None:
+            return []
+        return list(old.getBuffer())
 
 class PacketQueue:
     
@@ -0,0 +1,273 @@
+# Rendering of swarms: ASCII text, PNG images and animated PNG traces
+# Works with anything that offers getDevices() and getNeighborsDict(), i.e. Grid and ContinuousSwarm.
+# Images are written with zlib only, so no imaging library is needed.
+
+import struct, zlib
+import numpy as np
+
+BACKGROUND = 255
+EDGE = 190
+NODE = 0
+
+def devicePositions(grid):
+    """
+        Coordinates of every device in a swarm.
+
+        Parameters
+        ----------
+        grid: Grid or ContinuousSwarm object
+            the swarm
+
+        Returns
+        -------
+        :tuple
+            (ids, xs, ys) numpy arrays, one entry per device
+    """
+    devices = grid.getDevices()
+    ids = np.array([d.getID() for d in devices], dtype=int)
+    xs = np.array([d.getCoordinate().getX() for d in devices], dtype=float)
+    ys = np.array([d.getCoordinate().getY() for d in devices], dtype=float)
+    return ids, xs, ys
+
+def renderASCII(grid, ulx=0, uly=0, lrx=None, lry=None):
+    """
+        Text rendering of the window [ulx, lrx) x [uly, lry) of a Grid.
+
+        Every cell is a fixed width field: dashes if it is empty, the node's zero padded
+        ID otherwise. The fields are laid out in a character array and joined once.
+
+        Parameters
+        ----------
+        grid: Grid object
+            the grid to render
+        ulx, uly: int
+            upper left corner of the window
+        lrx, lry: int
+            lower right corner of the window (exclusive), the edge of the grid if None
+
+        Returns
+        -------
+        :str
+            the rendering, one line per row of cells
+    """
+    size = grid.getSize()
+    if lrx is None:
+        lrx = size
+    if lry is None:
+        lry = size
+    ids, xs, ys = devicePositions(grid)
+    zpcount = len(str(ids.max() + 1)) if len(ids) else 0 # digits of the device count
+    blank = "-" * (zpcount + 1)
+
+    cells = np.full((max(0, lry - uly), max(0, lrx - ulx)), blank, dtype='<U' + str(zpcount + 1))
+    xs = xs.astype(int)
+    ys = ys.astype(int)
+    inside = (xs >= ulx) & (xs < lrx) & (ys >= uly) & (ys < lry)
+    # np.char.zfill fails on an empty array, e.g. a window of a sparse grid with no nodes in it
+    if inside.any():
+        labels = np.char.add("N", np.char.zfill(ids[inside].astype(str), zpcount))
+        cells[ys[inside] - uly, xs[inside] - ulx] = labels
+    return "".join(" ".join(row) + " \n" for row in cells.tolist())
+
+def rasterize(grid, scale=4, edges=False, ulx=0, uly=0, lrx=None, lry=None):
+    """
+        Grayscale image of a swarm: a black square per node on a white background.
+
+        Parameters
+        ----------
+        grid: Grid or ContinuousSwarm object
+            the swarm
+        scale: float
+            pixels per unit of distance (per cell of a Grid). below 1, several cells share a
+            pixel, so large swarms can be drawn small
+        edges: bool
+            also draw a gray line between every pair of neighbors
+        ulx, uly: float
+            upper left corner of the window to draw
+        lrx, lry: float
+            lower right corner of the window (exclusive), the edge of the swarm (inclusive) if None
+
+        Returns
+        -------
+        :numpy array
+            (height, width) uint8 image
+    """
+    size = grid.getSize()
+    right = size if lrx is None else lrx
+    bottom = size if lry is None else lry
+    block = max(1, int(np.ceil(scale))) # side of a node's square, in pixels
+    width = max(0, int(np.ceil((right - ulx) * scale))) + block
+    height = max(0, int(np.ceil((bottom - uly) * scale))) + block
+    image = np.full((height, width), BACKGROUND, dtype=np.uint8)
+    ids, xs, ys = devicePositions(grid)
+    inside = (xs >= ulx) & (ys >= uly)
+    inside &= (xs <= size) if lrx is None else (xs < lrx)
+    inside &= (ys <= size) if lry is None else (ys < lry)
+    px = np.floor((xs - ulx) * scale).astype(int)
+    py = np.floor((ys - uly) * scale).astype(int)
+
+    if edges:
+        index = np.zeros(ids.max() + 1 if len(ids) else 0, dtype=int)
+        index[ids] = np.arange(len(ids))
+        pairs = [(index[d.getID()], index[n.getID()]) for d, nl in grid.getNeighborsDict().items() for n in nl if d.getID() < n.getID()]
+        if pairs:
+            a, b = np.array(pairs).T
+            keep = inside[a] | inside[b] # lines leaving the window are cut off at its edge
+            a, b = a[keep], b[keep]
+            cx = px + block // 2
+            cy = py + block // 2
+            # sample every line at one point per pixel of its longest side
+            steps = np.maximum(np.abs(cx[b] - cx[a]), np.abs(cy[b] - cy[a])) + 1
+            line = np.repeat(np.arange(len(a)), steps)
+            t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(np.maximum(steps - 1, 1), steps)
+            lx = np.rint(cx[a][line] + t * (cx[b] - cx[a])[line]).astype(int)
+            ly = np.rint(cy[a][line] + t * (cy[b] - cy[a])[line]).astype(int)
+            visible = (lx >= 0) & (lx < width) & (ly >= 0) & (ly < height)
+            image[ly[visible], lx[visible]] = EDGE
+
+    px = px[inside]
+    py = py[inside]
+    offsets = np.arange(block)
+    rows = (py[:,None,None] + offsets[None,:,None]).repeat(block, axis=2)
+    cols = (px[:,None,None] + offsets[None,None,:]).repeat(block, axis=1)
+    image[rows.ravel(), cols.ravel()] = NODE
+    return image
+
+def pngChunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def pngData(image):
+    # zlib stream of the image's scanlines, each behind a 'no filter' byte
+    image = np.asarray(image, dtype=np.uint8)
+    rows = image.reshape(image.shape[0], -1)
+    raw = np.hstack((np.zeros((rows.shape[0], 1), dtype=np.uint8), rows))
+    return zlib.compress(raw.tobytes())
+
+def pngHeader(image):
+    # IHDR chunk for an 8 bit grayscale (height, width) or RGB (height, width, 3) image
+    colorType = 2 if image.ndim == 3 else 0
+    return pngChunk(b'IHDR', struct.pack('>IIBBBBB', image.shape[1], image.shape[0], 8, colorType, 0, 0, 0))
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def writePNG(path, image):
+    """
+        Write an 8 bit grayscale or RGB image as a PNG file.
+
+        Parameters
+        ----------
+        path: str
+            file to write
+        image: numpy array
+            (height, width) or (height, width, 3) uint8 image
+    """
+    image = np.asarray(image, dtype=np.uint8)
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE + pngHeader(image) + pngChunk(b'IDAT', pngData(image)) + pngChunk(b'IEND', b''))
+
+class APNGWriter:
+    # writes an animated PNG one frame at a time, so a long trace is never held in memory
+    # the frame count is patched into the header when the writer is closed
+
+    def __init__(self, path, delay=100):
+        self.__file = open(path, 'wb')
+        self.__delay = delay # milliseconds per frame
+        self.__numFrames = 0
+        self.__sequence = 0 # APNG sequence number of the next fcTL/fdAT chunk
+        self.__shape = None
+        self.__actlOffset = None
+
+    def addFrame(self, image):
+        image = np.asarray(image, dtype=np.uint8)
+        if self.__shape is None:
+            self.__shape = image.shape
+            self.__file.write(PNG_SIGNATURE + pngHeader(image))
+            self.__actlOffset = self.__file.tell()
+            self.__file.write(pngChunk(b'acTL', struct.pack('>II', 0, 0)))
+        elif image.shape != self.__shape:
+            raise ValueError("every frame must have the same shape")
+
+        control = struct.pack('>IIIIIHHBB', self.__sequence, image.shape[1], image.shape[0], 0, 0, self.__delay, 1000, 0, 0)
+        self.__file.write(pngChunk(b'fcTL', control))
+        self.__sequence += 1
+        data = pngData(image)
+        if self.__numFrames == 0:
+            self.__file.write(pngChunk(b'IDAT', data))
+        else:
+            self.__file.write(pngChunk(b'fdAT', struct.pack('>I', self.__sequence) + data))
+            self.__sequence += 1
+        self.__numFrames += 1
+
+    def close(self):
+        if self.__numFrames:
+            self.__file.write(pngChunk(b'IEND', b''))
+            self.__file.seek(self.__actlOffset)
+            self.__file.write(pngChunk(b'acTL', struct.pack('>II', self.__numFrames, 0)))
+        self.__file.close()
+
+    def getNumFrames(self):
+        return self.__numFrames
+
+def traceFrames(grid, numFrames, scale=4, edges=False, window=None):
+    """
+        Images of a swarm as it moves, made one at a time.
+
+        The first frame is the swarm as it is; every following frame is taken after
+        one call to grid.mutate().
+
+        Parameters
+        ----------
+        grid: Grid or ContinuousSwarm object
+            the swarm, which is mutated in place
+        numFrames: int
+            number of frames
+        scale: float
+            pixels per unit of distance
+        edges: bool
+            also draw the links between neighbors
+        window: tuple
+            (ulx, uly, lrx, lry) of the part to draw, see rasterize(). all of the swarm if None
+
+        Returns
+        -------
+        :generator
+            (height, width) uint8 images
+    """
+    for i in range(numFrames):
+        if i:
+            grid.mutate()
+        yield rasterize(grid, scale, edges, *(window or ()))
+
+def exportTrace(grid, path, numFrames, scale=4, edges=False, delay=100, window=None):
+    """
+        Stream a mobility trace of a swarm to an animated PNG, or to numbered PNG files.
+
+        Parameters
+        ----------
+        grid: Grid or ContinuousSwarm object
+            the swarm, which is mutated in place
+        path: str
+            animated PNG to write. if it contains '{}', one PNG per frame is written
+            instead, with the frame number substituted, e.g. 'frames/swarm_{:04d}.png'
+        numFrames: int
+            number of frames
+        scale: float
+            pixels per unit of distance
+        edges: bool
+            also draw the links between neighbors
+        delay: int
+            milliseconds per frame of the animation
+        window: tuple
+            (ulx, uly, lrx, lry) of the part to draw, see rasterize(). all of the swarm if None
+    """
+    frames = traceFrames(grid, numFrames, scale, edges, window)
+    if '{' in path:
+        for i, image in enumerate(frames):
+            writePNG(path.format(i), image)
+        return
+    writer = APNGWriter(path, delay)
+    try:
+        for image in frames:
+            writer.addFrame(image)
+    finally:
+        writer.close()
@@ -0,0 +1,92 @@
+# Per-node route cache: next-hop tables learned from discovered routes
+
+__all__ = ['RouteCache']
+
+class RouteCache:
+
+    def __init__(self, lifetime=100):
+        self.__lifetime = lifetime # number of timeslots an unused entry stays valid
+        self.__tables = {} # for each node, a dictionary of target -> [next hop, expiry timeslot]
+        self.__now = 0 # newest timeslot of the attached simulation the cache has seen
+
+    def attach(self, timeSlot=0):
+        # a new simulation starts using the cache at its timeslot timeSlot. expiries are on the clock
+        # of the simulation that set them, so they are shifted to make the newest timeslot seen so far
+        # line up with timeSlot: every entry keeps the number of timeslots it had left, however long
+        # the earlier simulations ran
+        shift = timeSlot - self.__now
+        for table in self.__tables.values():
+            for entry in table.values():
+                entry[1] += shift
+        self.__now = timeSlot
+
+    def advance(self, timeSlot):
+        # the attached simulation has reached timeSlot
+        self.__now = max(self.__now, timeSlot)
+
+    def learn(self, route, timeSlot):
+        # installs next hops along route in both directions, for every node on the route
+        self.advance(timeSlot)
+        expiry = timeSlot + self.__lifetime
+        for i in range(len(route)):
+            table = self.__tables.setdefault(route[i], {})
+            for j in range(i + 1, len(route)):
+                table[route[j]] = [route[i + 1], expiry]
+            for j in range(i):
+                table[route[j]] = [route[i - 1], expiry]
+
+    def lookup(self, node, target, timeSlot):
+        # next hop from node towards target, or None if there is no valid entry
+        # using an entry refreshes its expiry, like an active route in AODV
+        self.advance(timeSlot)
+        table = self.__tables.get(node)
+        if table is None or target not in table:
+            return None
+        entry = table[target]
+        if entry[1] < timeSlot: # expired
+            del table[target]
+            return None
+        entry[1] = timeSlot + self.__lifetime
+        return entry[0]
+
+    def getRoute(self, source, target, timeSlot):
+        # full route source -> target following cached next hops, or None if it is broken or loops
+        route = [source]
+        seen = {source}
+        node = source
+        while node != target:
+            node = self.lookup(node, target, timeSlot)
+            if node is None or node in seen:
+                return None
+            route.append(node)
+            seen.add(node)
+        return route
+
+    def invalidate(self, neighborsDict):
+        # removes every entry whose next hop is no longer a neighbor, e.g. after the grid mutates
+        # returns the number of entries removed
+        removed = 0
+        for node, table in self.__tables.items():
+            neighbors = set(neighborsDict.get(node, []))
+            broken = [target for target, entry in table.items() if entry[0] not in neighbors]
+            for target in broken:
+                del table[target]
+            removed += len(broken)
+        return removed
+
+    def forget(self, node):
+        # removes node's table and every entry that leads to or through it, e.g. when it leaves the swarm
+        # returns the number of entries removed
+        removed = len(self.__tables.pop(node, {}))
+        for table in self.__tables.values():
+            broken = [target for target, entry in table.items() if target == node or entry[0] == node]
+            for target in broken:
+                del table[target]
+            removed += len(broken)
+        return removed
+
+    def getTables(self):
+        return self.__tables
+
+    def size(self):
+        return sum(len(table) for table in self.__tables.values())
@@ -0,0 +1,234 @@
+# Parameter sweeps that run trials on a process pool and report results as they complete
+#
+# Trial i of every configuration uses the i-th generator of spawnRNGs(seed, ...), so the
+# configurations are compared on the same random swarms and a sweep gives the same numbers
+# however its trials are spread over the workers.
+#
+# In a notebook:
+#     async for r in sweep([{'size': 15, 'r_rad': 6, 'm_rad': m} for m in (2, 3)]):
+#         print(r.config, r.stats.getCount(), r.stats.getMean())
+
+import asyncio
+import math
+import multiprocessing
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Worker import runTrial
+
+__all__ = ['METRICS', 'RunningStats', 'TrialResult', 'sweep', 'runSweep', 'importTime']
+
+# names of the values Simulation.end() returns, in order
+METRICS = ['aodv_time', 'aodv_overhead', 'aodv_queue',
+           'olsr_time', 'olsr_overhead', 'olsr_queue',
+           'custom_time', 'custom_overhead', 'custom_queue',
+           'sparsity']
+
+class RunningStats:
+    # online mean and variance of a vector of measurements (Welford's algorithm),
+    # so a sweep never keeps the individual results
+    # a missing value (None or nan, e.g. the results of a protocol that got cut off) is not
+    # a measurement: every metric counts its own measurements, and the missing ones are
+    # the difference to the number of trials
+
+    def __init__(self, names=METRICS):
+        self.__names = list(names)
+        self.__count = 0 # trials added
+        self.__counts = np.zeros(len(self.__names), dtype=int) # measurements of each metric
+        self.__mean = np.zeros(len(self.__names))
+        self.__squares = np.zeros(len(self.__names)) # sum of squared differences from the mean
+
+    def add(self, values):
+        values = np.array([np.nan if v is None else v for v in values], dtype=float)
+        measured = np.isfinite(values)
+        self.__count += 1
+        self.__counts[measured] += 1
+        delta = values[measured] - self.__mean[measured]
+        self.__mean[measured] += delta / self.__counts[measured]
+        self.__squares[measured] += delta * (values[measured] - self.__mean[measured])
+
+    def getCount(self):
+        return self.__count
+
+    def getCounts(self):
+        # number of measurements of each metric
+        return dict(zip(self.__names, self.__counts.tolist()))
+
+    def getMissing(self):
+        # number of trials without a measurement of each metric
+        return dict(zip(self.__names, (self.__count - self.__counts).tolist()))
+
+    def getNames(self):
+        return self.__names
+
+    def getMean(self):
+        # nan for a metric without measurements
+        mean = np.where(self.__counts > 0, self.__mean, np.nan)
+        return dict(zip(self.__names, mean.tolist()))
+
+    def getVariance(self):
+        # sample variance, 0 until there are two measurements
+        variance = self.__squares / np.maximum(self.__counts - 1, 1)
+        return dict(zip(self.__names, variance.tolist()))
+
+    def halfWidths(self, z=1.96):
+        # half widths of the normal confidence intervals of the means, inf until there are two measurements
+        counts = np.maximum(self.__counts, 2)
+        widths = z * np.sqrt(self.__squares / (counts - 1) / counts)
+        return np.where(self.__counts >= 2, widths, math.inf)
+
+    def getInterval(self, z=1.96):
+        # (low, high) confidence interval of each mean. z=1.96 is 95%
+        h = self.halfWidths(z)
+        return {name: (m - w, m + w) for name, m, w in zip(self.__names, self.getMean().values(), h.tolist())}
+
+    def isTight(self, tolerance, watch=None, z=1.96, floor=1e-3):
+        # whether the interval of every watched mean is within tolerance of the mean, relatively,
+        # or within floor of it, absolutely, so that a mean of 0 can be tight too
+        # watch is a list of metric names, all of them if None
+        h = self.halfWidths(z)
+        rows = [self.__names.index(name) for name in watch] if watch else slice(None)
+        return bool(np.all(h[rows] <= np.maximum(tolerance * np.abs(self.__mean[rows]), floor)))
+
+class TrialResult:
+    # one finished trial, with the running statistics of its configuration so far
+
+    def __init__(self, index, config, trial, values, stats, converged):
+        self.index = index # position of the configuration in the sweep
+        self.config = config
+        self.trial = trial
+        self.values = dict(zip(stats.getNames(), values))
+        self.stats = stats
+        self.converged = converged # the configuration needs no more trials
+
+    def __repr__(self):
+        return "TrialResult(" + str(self.config) + " #" + str(self.trial) + ")"
+
+async def sweep(configs, seed=0, minTrials=10, maxTrials=100, tolerance=0.05, watch=None, z=1.96, floor=1e-3, workers=None, executor=None, startMethod=None):
+    """
+        Run trials of several configurations on a process pool, yielding each result as it completes.
+
+        A configuration stops getting new trials once it has minTrials results and the
+        confidence interval of every watched mean is within tolerance of the mean, or once
+        it has had maxTrials trials. Trials already running when it stops still report.
+
+        A protocol that got cut off reports None (see Simulation.end); those are counted
+        as missing, not averaged in, so a metric's interval only tightens with real
+        measurements. RunningStats.getMissing() gives how many there were.
+
+        Parameters
+        ----------
+        configs: list
+            one dict of Grid keyword arguments per configuration, see Worker.runTrial
+        seed: int
+            seed of the whole sweep
+        minTrials, maxTrials: int
+            fewest and most trials per configuration
+        tolerance: float
+            largest accepted interval half width, relative to the mean
+        floor: float
+            interval half width that is always accepted, for means at or near 0
+        watch: list
+            names of the metrics whose intervals must be tight, all of METRICS if None
+        z: float
+            normal quantile of the intervals. 1.96 is 95%
+        workers: int
+            number of worker processes, one per CPU if None
+        executor: concurrent.futures.Executor
+            pool to run the trials on instead of a new process pool. it is left open
+        startMethod: str
+            how the new pool starts its workers: 'spawn', 'fork' or 'forkserver',
+            the platform's default if None. spawned workers only import Worker
+
+        Returns
+        -------
+        :async generator
+            TrialResult objects, in the order the trials finish
+    """
+    loop = asyncio.get_running_loop()
+    pool = executor or ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(startMethod))
+    inFlight = 2 * (workers or getattr(pool, '_max_workers', None) or 1) # keeps every worker busy
+    stats = [RunningStats() for _ in configs]
+    submitted = [0] * len(configs)
+    done = [False] * len(configs)
+    pending = {} # future -> (configuration index, trial)
+
+    def submit():
+        # start trials, spreading them over the unfinished configurations with the fewest trials
+        while len(pending) < inFlight:
+            waiting = [i for i in range(len(configs)) if not done[i] and submitted[i] < maxTrials]
+            if not waiting:
+                return
+            i = min(waiting, key=lambda i: submitted[i])
+            future = loop.run_in_executor(pool, runTrial, configs[i], seed, submitted[i])
+            pending[future] = (i, submitted[i])
+            submitted[i] += 1
+
+    try:
+        submit()
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                i, trial = pending.pop(future)
+                values = future.result()
+                stats[i].add(values)
+                if stats[i].getCount() >= minTrials and stats[i].isTight(tolerance, watch, z, floor):
+                    done[i] = True
+                if submitted[i] >= maxTrials:
+                    done[i] = True
+                yield TrialResult(i, configs[i], trial, values, stats[i], done[i])
+            submit()
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def runSweep(configs, **kwargs):
+    """
+        Run a sweep to the end without asyncio, e.g. from a script.
+
+        Parameters
+        ----------
+        configs: list
+            one dict of Grid keyword arguments per configuration
+        kwargs:
+            any other arguments of sweep()
+
+        Returns
+        -------
+        :obj:list
+            the RunningStats of each configuration
+    """
+    async def collect():
+        stats = [None] * len(configs)
+        async for r in sweep(configs, **kwargs):
+            stats[r.index] = r.stats
+        return stats
+    return asyncio.run(collect())
+
+def importTime(module, repeats=5):
+    """
+        Time the import of a module in a fresh interpreter, as a spawned worker would.
+
+        Parameters
+        ----------
+        module: str
+            name of the module, e.g. 'Worker' or 'simulation'
+        repeats: int
+            number of interpreters to time
+
+        Returns
+        -------
+        :float
+            median import time in seconds
+    """
+    code = "import time; t = time.perf_counter(); import " + module + "; print(time.perf_counter() - t)"
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = [float(subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True, check=True).stdout)
+             for _ in range(repeats)]
+    return float(np.median(times))
@@ -0,0 +1,246 @@
+# Multi-hop analytics of the swarm graph: hop counts, diameter, articulation points
+# and shortest-path baselines to compare the protocols' routes and overhead against
+#
+# The graph is taken from getNeighborsDict() (or getNeighborsCSR() when the swarm has it)
+# and stored in CSR layout with one row per node ID. Breadth first searches expand the
+# frontiers of a whole batch of sources at once with numpy.
+
+import numpy as np
+
+def adjacency(grid):
+    """
+        CSR adjacency of a swarm, indexed by node ID.
+
+        Parameters
+        ----------
+        grid: Grid or ContinuousSwarm object
+            the swarm
+
+        Returns
+        -------
+        :tuple
+            (indptr, indices, present) numpy arrays. the neighbors of node i are
+            indices[indptr[i]:indptr[i+1]]; present[i] is False for IDs no node has
+    """
+    if hasattr(grid, 'getNeighborsCSR'):
+        indptr, indices = grid.getNeighborsCSR()
+        return indptr, indices, np.ones(len(indptr) - 1, dtype=bool)
+    neighborsDict = grid.getNeighborsDict()
+    numIDs = max((d.getID() for d in neighborsDict), default=-1) + 1
+    counts = np.zeros(numIDs, dtype=int)
+    present = np.zeros(numIDs, dtype=bool)
+    for d, nl in neighborsDict.items():
+        counts[d.getID()] = len(nl)
+        present[d.getID()] = True
+    indptr = np.r_[0, np.cumsum(counts)]
+    indices = np.empty(indptr[-1], dtype=int)
+    for d, nl in neighborsDict.items():
+        i = d.getID()
+        indices[indptr[i]:indptr[i+1]] = [n.getID() for n in nl]
+    return indptr, indices, present
+
+def hopCounts(indptr, indices, sources):
+    """
+        Hop counts from each of a batch of sources to every node.
+
+        Parameters
+        ----------
+        indptr, indices: numpy array
+            CSR adjacency, see adjacency()
+        sources: numpy array
+            node IDs to search from
+
+        Returns
+        -------
+        :numpy array
+            (len(sources), number of nodes) int32 array of hop counts, -1 where unreachable
+    """
+    numNodes = len(indptr) - 1
+    sources = np.asarray(sources, dtype=int)
+    hops = np.full((len(sources), numNodes), -1, dtype=np.int32)
+    flat = hops.reshape(-1) # indexed by row * numNodes + node
+    frontier = np.zeros(flat.shape, dtype=bool) # nodes reached at the current depth
+    rows = np.arange(len(sources))
+    hops[rows, sources] = 0
+    depth = 0
+    while len(sources):
+        depth += 1
+        starts = indptr[sources]
+        counts = indptr[sources + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = np.repeat(rows * numNodes, counts) + indices[np.repeat(starts, counts) + offsets]
+        frontier[keys[flat[keys] < 0]] = True
+        keys = np.flatnonzero(frontier) # sorted and without repeats
+        frontier[keys] = False
+        flat[keys] = depth
+        rows, sources = keys // numNodes, keys % numNodes
+    return hops
+
+def hopBatches(indptr, indices, nodes=None, batchSize=256):
+    """
+        All-pairs hop counts, one batch of sources at a time.
+
+        Parameters
+        ----------
+        indptr, indices: numpy array
+            CSR adjacency, see adjacency()
+        nodes: numpy array
+            sources to search from, every node if None
+        batchSize: int
+            number of sources per batch. memory use is batchSize x number of nodes
+
+        Returns
+        -------
+        :generator
+            (sources, hops) pairs, hops as returned by hopCounts()
+    """
+    if nodes is None:
+        nodes = np.arange(len(indptr) - 1)
+    for i in range(0, len(nodes), batchSize):
+        batch = nodes[i:i+batchSize]
+        yield batch, hopCounts(indptr, indices, batch)
+
+def articulationPoints(indptr, indices):
+    """
+        Nodes whose removal would split their part of the swarm.
+
+        Tarjan's depth first search, run with an explicit stack.
+
+        Parameters
+        ----------
+        indptr, indices: numpy array
+            CSR adjacency, see adjacency()
+
+        Returns
+        -------
+        :numpy array
+            sorted node IDs of the articulation points
+    """
+    numNodes = len(indptr) - 1
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    order = [-1] * numNodes # discovery time of each node, -1 if not visited
+    low = [0] * numNodes # earliest discovery time reachable through the node's subtree
+    cut = [False] * numNodes
+    time = 0
+    for root in range(numNodes):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = time
+        time += 1
+        children = 0
+        stack = [(root, -1, indptr[root])] # (node, parent, next position in its neighbor list)
+        while stack:
+            node, parent, pos = stack[-1]
+            if pos < indptr[node + 1]:
+                stack[-1] = (node, parent, pos + 1)
+                n = indices[pos]
+                if order[n] < 0:
+                    order[n] = low[n] = time
+                    time += 1
+                    if node == root:
+                        children += 1
+                    stack.append((n, node, indptr[n]))
+                elif n != parent:
+                    low[node] = min(low[node], order[n])
+            else:
+                stack.pop()
+                if parent >= 0:
+                    low[parent] = min(low[parent], low[node])
+                    if parent != root and low[node] >= order[parent]:
+                        cut[parent] = True
+        if children > 1:
+            cut[root] = True
+    return np.flatnonzero(cut)
+
+class TopologyAnalytics:
+    # analytics of one swarm. results are cached until the swarm's topology changes,
+    # which is detected with grid.getVersion(), so asking again within an epoch is free
+
+    def __init__(self, grid, batchSize=256):
+        self.__grid = grid
+        self.__batchSize = batchSize
+        self.__version = None # topology version the cache belongs to
+        self.__cache = {}
+
+    # CSR adjacency of the current topology, clearing the cache if the topology changed
+    def refresh(self):
+        version = self.__grid.getVersion()
+        if version != self.__version:
+            self.__version = version
+            self.__cache = {'adjacency': adjacency(self.__grid), 'rows': {}}
+        return self.__cache['adjacency']
+
+    # hop counts from source to every node, -1 where unreachable
+    def hopsFrom(self, source):
+        indptr, indices, present = self.refresh()
+        rows = self.__cache['rows']
+        if source not in rows:
+            rows[source] = hopCounts(indptr, indices, [source])[0]
+        return rows[source]
+
+    # number of hops on a shortest path from source to target, -1 if there is none
+    def getHops(self, source, target):
+        return int(self.hopsFrom(source)[target])
+
+    # a shortest path from source to target as a list of node IDs, None if there is none
+    # of several shortest paths, the one through the smallest IDs nearest the target is picked
+    def shortestPath(self, source, target):
+        hops = self.hopsFrom(source)
+        if hops[target] < 0:
+            return None
+        indptr, indices, present = self.refresh()
+        path = [target]
+        node = target
+        while node != source:
+            neighbors = indices[indptr[node]:indptr[node+1]]
+            node = int(neighbors[hops[neighbors] == hops[node] - 1].min())
+            path.append(node)
+        return path[::-1]
+
+    # the optimal-path baseline for a flow: hop count of the shortest route and the
+    # fewest transmissions a discovery round trip needs (request out, reply back)
+    def baseline(self, source, target):
+        hops = self.getHops(source, target)
+        return {'hops': hops, 'roundTrip': 2 * hops if hops >= 0 else -1}
+
+    # eccentricity, connectivity and path length statistics over all pairs, computed in batches
+    def pathStatistics(self):
+        self.refresh()
+        if 'paths' not in self.__cache:
+            indptr, indices, present = self.__cache['adjacency']
+            nodes = np.flatnonzero(present)
+            eccentricity = np.zeros(len(indptr) - 1, dtype=int)
+            total = 0
+            pairs = 0
+            for sources, hops in hopBatches(indptr, indices, nodes, self.__batchSize):
+                hops = hops[:, present]
+                eccentricity[sources] = hops.max(axis=1)
+                reached = hops > 0
+                total += int(hops[reached].sum())
+                pairs += int(reached.sum())
+            self.__cache['paths'] = {'eccentricity': eccentricity,
+                                     'connected': pairs == len(nodes) * (len(nodes) - 1),
+                                     'averageHops': total / pairs if pairs else 0.0}
+        return self.__cache['paths']
+
+    # longest shortest path between any two connected nodes, in hops
+    def diameter(self):
+        return int(self.pathStatistics()['eccentricity'].max(initial=0))
+
+    # nodes whose removal would split the swarm
+    def getArticulationPoints(self):
+        self.refresh()
+        if 'cuts' not in self.__cache:
+            indptr, indices, present = self.__cache['adjacency']
+            self.__cache['cuts'] = articulationPoints(indptr, indices)
+        return self.__cache['cuts']
+
+    # one dictionary of the swarm's topology measurements
+    def summary(self):
+        stats = self.pathStatistics()
+        indptr, indices, present = self.refresh()
+        return {'nodes': int(present.sum()), 'links': len(indices) // 2,
+                'connected': stats['connected'], 'diameter': self.diameter(),
+                'averageHops': stats['averageHops'],
+                'articulationPoints': len(self.getArticulationPoints())}
@@ -0,0 +1,73 @@
+# Traffic workloads: many source/target flows sharing one simulation
+
+import numpy as np
+
+__all__ = ['Flow', 'generateFlows']
+
+class Flow:
+
+    def __init__(self, id, source, target, start=0, numData=0):
+        self.__id = id
+        self.__source = source
+        self.__target = target
+        self.__start = start # timeslot at which the source starts route discovery
+        self.__numData = numData # data packets sent once the route is found
+
+    def getID(self):
+        return self.__id
+
+    def getSource(self):
+        return self.__source
+
+    def getTarget(self):
+        return self.__target
+
+    def getStart(self):
+        return self.__start
+
+    def getNumData(self):
+        return self.__numData
+
+    def __repr__(self):
+        return "Flow" + str(self.__id) + "(" + str(self.__source) + "->" + str(self.__target) + " at " + str(self.__start) + ")"
+
+def generateFlows(numNodes, numFlows, arrival='batch', rate=0.1, numData=0, rng=None):
+    """
+        Generate a traffic workload of concurrent flows.
+
+        Parameters
+        ----------
+        numNodes: int
+            number of nodes in the swarm
+        numFlows: int
+            number of flows to generate
+        arrival: str
+            'batch' starts every flow at timeslot 0, 'poisson' starts flows
+            as a Poisson process with the given rate
+        rate: float
+            mean number of flow arrivals per timeslot for 'poisson' arrivals
+        numData: int
+            number of data packets each flow sends after route discovery
+        rng: numpy Generator
+            random number generator to draw from, a fresh one if None
+
+        Returns
+        -------
+        :obj:list
+            list of Flow objects ordered by start time
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if arrival == 'batch':
+        starts = np.zeros(numFlows, dtype=int)
+    elif arrival == 'poisson':
+        starts = np.floor(np.cumsum(rng.exponential(1 / rate, numFlows))).astype(int)
+    else:
+        raise ValueError("unknown arrival process " + str(arrival))
+
+    flows = []
+    for i in range(numFlows):
+        # randomly choose the source and destination nodes
+        choice = rng.choice(numNodes, 2, replace=False)
+        flows.append(Flow(i, choice[0], choice[1], int(starts[i]), numData))
+    return flows
@@ -0,0 +1,35 @@
+# Entry point of sweep worker processes
+# A worker started with the spawn method imports the module of the function it runs. This
+# module imports only what a trial needs, so workers skip asyncio, the process pool and the
+# optional modules that Sweep itself uses.
+
+import numpy as np
+
+from simulation import Grid, Simulation
+
+__all__ = ['runTrial']
+
+def runTrial(config, seed, trial):
+    """
+        Run one Simulation for a sweep configuration.
+
+        Parameters
+        ----------
+        config: dict
+            keyword arguments of Grid, including size. maxTimeslots, if present,
+            is passed to Simulation instead
+        seed: int
+            seed of the whole sweep
+        trial: int
+            number of the trial within its configuration
+
+        Returns
+        -------
+        :obj:list
+            the results of Simulation.end(), None for a protocol that got cut off
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(trial,))) # same as spawnRNGs(seed, n)[trial]
+    params = dict(config)
+    maxTimeslots = params.pop('maxTimeslots', 5000)
+    size = params.pop('size')
+    return Simulation(Grid(size, rng=rng, **params), maxTimeslots).end()
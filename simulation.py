@@ -1,11 +1,34 @@
 # File for running simulation
+#
+# 'from simulation import *' gives the simulations and the classes they are built from
+# (see __all__). The other modules are loaded on first use, e.g. simulation.Topology, so
+# importing simulation only pays for what every simulation needs.
 
+import importlib
 import numpy as np
 import copy
 
 from Grid import *
 from Packet import *
 from Queues import *
+from Traffic import *
+from RouteCache import *
+
+__all__ = ['get_p', 'transmissions', 'spawnRNGs', 'getNeighbors', 'newestOffers',
+           'Simulation', 'TrafficSimulation', 'AODVSimulation', 'OLSRSimulation', 'CustomSimulation',
+           'Grid', 'Node', 'Point',
+           'Packet', 'RouteRequest', 'RouteReply', 'DataPacket', 'LinkState',
+           'QueueHolder', 'PacketQueue', 'Flow', 'generateFlows', 'RouteCache']
+
+# modules loaded on first access as attributes of this module
+LAZY_MODULES = ['Benchmark', 'Checkpoint', 'Ensemble', 'Mobility', 'Render', 'Sweep', 'Topology', 'Worker']
+
+def __getattr__(name):
+    if name in LAZY_MODULES:
+        module = importlib.import_module(name)
+        globals()[name] = module
+        return module
+    raise AttributeError("module 'simulation' has no attribute " + repr(name))
 
 def get_p(grid, node):
     """
@@ -27,7 +50,7 @@ def get_p(grid, node):
     # for now return a constant
     return 0.3
 
-def transmissions(grid, numNodes):
+def transmissions(grid, numNodes, rng=None):
     """
         Which nodes transmit in the current timeslot.
 
@@ -35,18 +58,41 @@ def transmissions(grid, numNodes):
         ----------
         grid: Grid object
             the grid of the swarm
+        numNodes: int
+            number of nodes in the swarm
+        rng: numpy Generator
+            random number generator to draw from, a fresh one if None
 
         Returns
         -------
         :obj:list
             list of nodes that will transmit in the current timeslot
     """
-    transmissions = []
-    for node in np.arange(numNodes):
-        p = get_p(grid, node)
-        if np.random.choice(2, p=[1-p, p]):
-            transmissions.append(node)
-    return transmissions
+    if rng is None:
+        rng = np.random.default_rng()
+    p = np.array([get_p(grid, node) for node in range(numNodes)])
+    return np.flatnonzero(rng.random(numNodes) < p).tolist()
+
+def spawnRNGs(seed, n):
+    """
+        Independent random number generators, e.g. one per trial of a sweep.
+
+        Every generator comes from its own child of a SeedSequence, so trial i gets
+        the same stream no matter how the trials are split between workers.
+
+        Parameters
+        ----------
+        seed: int
+            seed of the whole sweep
+        n: int
+            number of generators
+
+        Returns
+        -------
+        :obj:list
+            list of n numpy Generators
+    """
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n)]
 
 def getNeighbors(neighborsDict):
     """
@@ -71,14 +117,63 @@ def getNeighbors(neighborsDict):
         newList = []
         for n in neighbors:
             newList.append(n.getID())
-            newDict[keyID] = newList
+        newDict[keyID] = newList
     return newDict
 
+def newestOffers(keys, stamps, candidates, received):
+    """
+        Decide which of a sequence of packet offers are new to their receivers.
+
+        Offers are handled in order, as if one at a time: an offer is accepted if its
+        timestamp is newer than what the receiver already has and newer than every
+        earlier offer to the same receiver.
+
+        Parameters
+        ----------
+        keys: numpy array
+            receiver of each offer
+        stamps: numpy array
+            non-negative timestamp of each offer
+        candidates: numpy array
+            boolean mask of the offers that may be accepted; the others are ignored
+        received: numpy array
+            newest timestamp each receiver already has, -1 if none, indexed by key
+
+        Returns
+        -------
+        :numpy array
+            boolean mask of the accepted offers
+    """
+    if not len(keys):
+        return np.zeros(0, dtype=bool)
+    # newest timestamp offered to each receiver by the offers before it: a running maximum
+    # over the offers grouped by receiver. shifting every group above the previous one
+    # keeps the maximum from carrying across groups
+    order = np.lexsort((np.arange(len(keys)), keys))
+    grouped = keys[order]
+    offered = np.where(candidates, stamps + 1, 0)[order] # +1 so that 0 means nothing offered
+    starts = np.r_[True, grouped[1:] != grouped[:-1]]
+    groups = np.cumsum(starts) - 1
+    shift = offered.max() + 1
+    running = np.maximum.accumulate(offered + groups * shift) - groups * shift
+    earlier = np.r_[0, running[:-1]]
+    earlier[starts] = 0
+    best = np.empty_like(earlier)
+    best[order] = earlier
+    return candidates & (stamps > np.maximum(received[keys], best - 1))
+
 class Simulation:
     """
         Runs various simulations: AODV, OLSR, CUSTOM
     """
-    def __init__(self, grid, maxTimeslots=5000):
+    def __init__(self, grid, maxTimeslots=5000, run=True, rng=None, olsrRefresh='periodic'):
+        # olsrRefresh is how OLSR sends out link states, 'periodic' or 'adaptive' (see OLSRSimulation)
+        # if run is False, the simulation is only set up. call run() to advance it, which
+        # allows pausing, checkpointing (see Checkpoint.py) and resuming
+        # rng is the numpy Generator for all of the simulation's randomness, the grid's if None
+        if rng is None:
+            rng = grid.getRNG()
+        self.rng = rng
         self.grid = grid
         self.neighbors = getNeighbors(self.grid.getNeighborsDict()) 
         self.numNodes = len(self.neighbors)
@@ -88,7 +183,7 @@ class Simulation:
         self.sparsity = 0
            
         # randomly choose the source and destination nodes
-        choice = np.random.choice(self.numNodes, 2, replace=False)
+        choice = self.rng.choice(self.numNodes, 2, replace=False)
         self.source = choice[0]
         self.target = choice[1]
 
@@ -100,31 +195,57 @@ class Simulation:
 
         # instantiate different simulations: AODV, OLSR, CUSTOM
         self.aodv = AODVSimulation(self.source, self.target, self.numNodes)
-        self.olsr = OLSRSimulation(self.source, self.target, self.numNodes)
+        self.olsr = OLSRSimulation(self.source, self.target, self.numNodes, rng=self.rng, refresh=olsrRefresh)
         self.olsr.chooseMPR(self.grid, self.numNodes, self.neighbors) # choose multi-point relays for OLSR simulation
         self.custom = CustomSimulation(self.source, self.target, self.numNodes)
         self.sparsity += self.grid.getSparsity()
 
+        if run:
+            self.run()
+
+    def run(self, timeslots=None, checkpointEvery=None, checkpointPath=None):
         # run through the simulations: OLSR, AODV, CUSTOM until they are all done
-        while (not self.olsr.isFinished() or not self.aodv.isFinished()) or not self.custom.isFinished() and (self.timeSlot < self.maxTimeslots):
-            send = transmissions(self.grid, self.numNodes) # choose nodes that will successfully transmit in this timeslot
-            if not self.aodv.isFinished():
-                self.aodv.step(self.timeSlot, self.grid, self.neighbors, send)
-            if not self.olsr.isFinished():
-                self.olsr.step(self.timeSlot, self.grid, self.neighbors, send)
-            if not self.custom.isFinished():
-                self.custom.step(self.timeSlot, self.grid, self.neighbors, send, self.nodeMovement)
-            self.mutate()
+        # if timeslots is given, stop after that many more timeslots
+        # if checkpointEvery is given, save a checkpoint to checkpointPath every checkpointEvery timeslots
+        # returns whether the simulation is done
+        if checkpointEvery and checkpointPath is None:
+            raise ValueError("checkpointEvery needs a checkpointPath to save to")
+        stop = self.maxTimeslots
+        if timeslots is not None:
+            stop = min(stop, self.timeSlot + timeslots)
+        while not self.isFinished() and (self.timeSlot < stop):
+            self.step()
+            if checkpointEvery and self.timeSlot % checkpointEvery == 0:
+                import Checkpoint
+                Checkpoint.save(self, checkpointPath)
+        return self.isFinished()
+
+    def step(self):
+        # runs a single timeslot
+        send = transmissions(self.grid, self.numNodes, self.rng) # choose nodes that will successfully transmit in this timeslot
+        if not self.aodv.isFinished():
+            self.aodv.step(self.timeSlot, self.grid, self.neighbors, send)
+        if not self.olsr.isFinished():
+            self.olsr.step(self.timeSlot, self.grid, self.neighbors, send)
+        if not self.custom.isFinished():
+            self.custom.step(self.timeSlot, self.grid, self.neighbors, send, self.nodeMovement)
+        self.mutate()
+
+    def isFinished(self):
+        # all protocols are done or the simulation got cut off
+        done = self.olsr.isFinished() and self.aodv.isFinished() and self.custom.isFinished()
+        return done or (self.timeSlot >= self.maxTimeslots)
             
     def end(self):
         # return results
-        arr =  [self.aodv.returnTimeslots(), self.aodv.returnOverhead(), self.aodv.returnQueueUsage()]
-        arr.append(self.olsr.returnTimeslots())
-        arr.append(self.olsr.returnOverhead())
-        arr.append(self.olsr.returnQueueUsage())
-        arr.append(self.custom.returnTimeslots())
-        arr.append(self.custom.returnOverhead())
-        arr.append(self.custom.returnQueueUsage())
+        # a protocol that got cut off at maxTimeslots never finished, so it has no time,
+        # overhead or queue usage to report: its three results are None
+        arr = []
+        for protocol in (self.aodv, self.olsr, self.custom):
+            if protocol.isFinished():
+                arr += [protocol.returnTimeslots(), protocol.returnOverhead(), protocol.returnQueueUsage()]
+            else:
+                arr += [None, None, None]
         arr.append(self.sparsity / self.timeSlot)
         return arr
 
@@ -135,44 +256,191 @@ class Simulation:
             self.nodeMovement = self.grid.mutate() # mutate the swarm
             self.custom.updateGraphNums(self.nodeMovement)
             self.neighbors = getNeighbors(self.grid.getNeighborsDict()) # update neighbors dictionary
+            self.olsr.linksChanged(self.timeSlot, self.neighbors, self.nodeMovement)
             if self.timeSlot % 100 == 0:
                 self.olsr.chooseMPR(self.grid, self.numNodes, self.neighbors) # update multi-point relays for OLSR
         self.timeSlot += 1
         self.sparsity += self.grid.getSparsity()
         return
+
+class TrafficSimulation:
+    """
+        Runs many concurrent flows over one grid with AODV, sharing the same queues
+    """
+    def __init__(self, grid, flows, maxTimeslots=5000, cache=None, rng=None, churn=None):
+        # churn is an optional (leave, join) pair: every time the grid mutates, that many nodes
+        # leave and join it (see Grid.churn). the flows' endpoints never leave
+        # cache is an optional RouteCache. flows whose route is cached skip discovery, and the data
+        # is forwarded hop by hop with the cached next hops. passing the same cache to several
+        # simulations lets later workloads reuse the routes found by earlier ones. each simulation
+        # attaches to the cache at its timeslot 0 and leaves it at its last timeslot, so an entry's
+        # remaining lifetime carries over from one workload to the next
+        # rng is the numpy Generator for the transmissions, the grid's if None
+        if rng is None:
+            rng = grid.getRNG()
+        self.rng = rng
+        self.grid = grid
+        self.neighbors = getNeighbors(self.grid.getNeighborsDict())
+        self.numNodes = len(self.neighbors)
+        self.maxTimeslots = maxTimeslots # simulation gets cut off after this so we don't infinite loop
+        self.timeSlot = 0
+        self.flows = flows
+        self.churn = churn
+        self.endpoints = {f.getSource() for f in flows} | {f.getTarget() for f in flows}
+
+        self.sparsity = self.grid.getSparsity()
+        self.cache = cache
+        if cache is not None:
+            cache.attach(0)
+        self.aodv = AODVSimulation(None, None, self.numNodes, flows=flows, cache=cache)
+
+        while not self.aodv.isFinished() and (self.timeSlot < self.maxTimeslots):
+            send = transmissions(self.grid, self.numNodes, self.rng) # choose nodes that will successfully transmit in this timeslot
+            self.aodv.step(self.timeSlot, self.grid, self.neighbors, send)
+            self.mutate()
+        if cache is not None:
+            cache.advance(self.timeSlot)
+
+    def end(self):
+        # return per-flow results
+        return self.aodv.returnFlowMetrics()
+
+    def throughput(self):
+        # data packets delivered per timeslot, over all flows
+        return sum(m['delivered'] for m in self.end()) / max(1, self.timeSlot)
+
+    def mutate(self):
+        # mutates the grid every 10 time slots
+        if self.timeSlot % 10 == 0 and self.timeSlot != 0:
+            self.grid.mutate()
+            if self.churn is not None:
+                left, joined = self.grid.churn(self.churn[0], self.churn[1], keep=self.endpoints)
+                self.numNodes = self.grid.getNumIDs()
+                self.aodv.nodesChanged(self.timeSlot, left, joined, self.numNodes)
+            self.neighbors = getNeighbors(self.grid.getNeighborsDict()) # update neighbors dictionary
+            self.aodv.linksChanged(self.neighbors) # drop cached next hops whose links broke
+        self.timeSlot += 1
+        self.sparsity += self.grid.getSparsity()
+        return
         
 class AODVSimulation:
     
-    def __init__(self, source, target, numNodes, timeout=100, retry=5):
-        self.__source = source
-        self.__target = target
+    def __init__(self, source, target, numNodes, timeout=100, retry=5, flows=None, cache=None):
+        # flows is a list of Flow objects. if it's None, the simulation has the single flow source -> target
+        # cache is an optional RouteCache: discovered routes are learned into it, flows whose route is
+        # already cached skip discovery, and data is forwarded with the cached next hops
+        if flows is None:
+            flows = [Flow(0, source, target)]
+        self.__flows = flows
+        self.__source = flows[0].getSource()
+        self.__target = flows[0].getTarget()
         self.__numNodes = numNodes
+        self.__numFlows = len(flows)
         self.__timeout = timeout # time before source node resends a discovery packets
         self.__retry = retry # number of times node should try to re-transmit a packet
         self.__queues = QueueHolder(numNodes) # queue for each node
         self.__finished = False # whether the simulation is done yet or not
-        self.__destinationReached = False # if the target node has been reached with an RREQ
-        self.__lastTimeout = 0 # time at which the last timeout occurred
-        self.__received = [None]*self.__numNodes # array of timestamps that record what RREQ packet a node has received (so it doesn't retransmit it)
-        self.beginDiscover(0) # put RREQ packet in the source's queue
+        
+        # state for each flow
+        self.__sources = np.array([f.getSource() for f in flows], dtype=int)
+        self.__targets = np.array([f.getTarget() for f in flows], dtype=int)
+        self.__started = np.zeros(self.__numFlows, dtype=bool) # if the flow has started route discovery
+        self.__destinationReached = np.zeros(self.__numFlows, dtype=bool) # if the target node has been reached with an RREQ
+        self.__discovered = np.full(self.__numFlows, -1) # time at which the reply got back to the source, -1 if it hasn't
+        self.__lastTimeout = np.array([f.getStart() for f in flows], dtype=int) # time at which the last timeout occurred
+        self.__received = np.full((self.__numFlows, self.__numNodes), -1) # array of timestamps that record what RREQ packet a node has received for each flow (so it doesn't retransmit it), -1 if none
+        self.__routes = [None]*self.__numFlows # route source -> target found by each flow's RREQ
+        self.__cache = cache
+        self.__reused = np.zeros(self.__numFlows, dtype=bool) # if the flow's route came from the cache
         
         # measurement variables for comparisons
         self.__totalTimeslots = 0
-        self.__totalOverhead = 0
         self.__queueLength = 0
+        self.__overhead = np.zeros(self.__numFlows, dtype=int) # transmissions made for each flow
+        self.__delivered = np.zeros(self.__numFlows, dtype=int) # data packets that reached the target
+        self.__lost = np.zeros(self.__numFlows, dtype=int) # data packets dropped after too many retransmits
+        self.__latency = np.zeros(self.__numFlows, dtype=int) # summed latency of the delivered data packets
         
-    def beginDiscover(self, timeSlot):
+        for flow in range(self.__numFlows):
+            if flows[flow].getStart() == 0:
+                self.startFlow(0, flow) # put RREQ packet in the source's queue
+        
+    def beginDiscover(self, timeSlot, flow=0):
         # put route request packet into source's queue. This happens at the beginning and when we reach timeout
-        packet = RouteRequest(timeSlot, self.__source, self.__target)
-        packet.addToPath(self.__source) 
-        self.__queues.getQueue(self.__source).pushToBack(packet) # add RREQ to the source queue
-        self.__received[self.__source] = timeSlot # record the timestamp of the packet
+        source = self.__sources[flow]
+        packet = RouteRequest(timeSlot, source, self.__targets[flow], flow)
+        packet.addToPath(source) 
+        self.__queues.getQueue(source).pushToBack(packet) # add RREQ to the source queue
+        self.__received[flow, source] = timeSlot # record the timestamp of the packet
+        self.__started[flow] = True
+        
+    def startFlow(self, timeSlot, flow):
+        # starts discovery for flow, unless its route is already in the cache
+        route = None
+        if self.__cache is not None:
+            route = self.__cache.getRoute(self.__sources[flow], self.__targets[flow], timeSlot)
+        if route is None:
+            self.beginDiscover(timeSlot, flow)
+            return
+        self.__started[flow] = True
+        self.__destinationReached[flow] = True
+        self.__reused[flow] = True
+        self.__routes[flow] = route
+        self.routeFound(timeSlot, flow)
         
+    def restartDiscovery(self, flow):
+        # the flow's route reply was lost before it got back to the source: forget that the target
+        # was reached and which nodes saw the requests, so the next timeout's request can reach it again
+        self.__destinationReached[flow] = False
+        self.__routes[flow] = None
+        self.__received[flow] = -1
+        
+    def linksChanged(self, neighborsDict):
+        # the grid mutated: drop cached next hops whose links broke
+        if self.__cache is not None:
+            self.__cache.invalidate(neighborsDict)
+        
+    def nodesChanged(self, timeSlot, left, joined, numNodes):
+        # nodes left or joined the swarm. IDs are recycled, so both get empty queues and
+        # forget the requests seen under their ID; the node IDs may now go up to numNodes
+        # data packets queued at a leaving node are lost, and cached routes through it are dropped
+        # a flow still discovering its route whose only route reply was dropped starts over: it may
+        # reach its target again, and its next timeout floods a new request
+        if numNodes > self.__numNodes:
+            grown = np.full((self.__numFlows, numNodes), -1)
+            grown[:, :self.__numNodes] = self.__received
+            self.__received = grown
+            self.__numNodes = numNodes
+        interrupted = set() # undiscovered flows that lost a request or reply
+        for node in list(left) + list(joined):
+            for packet in self.__queues.resetQueue(node):
+                if packet.getType() == 'Data':
+                    self.__lost[packet.getFlow()] += 1
+                elif self.__discovered[packet.getFlow()] < 0:
+                    interrupted.add(packet.getFlow())
+            self.__received[:, node] = -1
+        interrupted = [flow for flow in interrupted if self.__destinationReached[flow]]
+        if interrupted:
+            replying = {packet.getFlow() for queue in self.__queues.getQueueHolder().values()
+                        for packet in queue.getBuffer() if packet.getType() == 'RouteReply'}
+            for flow in interrupted:
+                if flow not in replying:
+                    self.restartDiscovery(flow)
+        if self.__cache is not None:
+            for node in left:
+                self.__cache.forget(node)
+        if len(left):
+            self.checkFinished(timeSlot)
+
     def step(self, timeSlot, grid, neighborsDict, transmissions):
-        # if it has been longer than timeout time slots, put a RREQ packet back in the source node's queue
-        if timeSlot - self.__lastTimeout > self.__timeout: # if timeout occurs, source should send out another RREQ
-            self.beginDiscover(timeSlot)
-            self.__lastTimeout = timeSlot
+        for flow in range(self.__numFlows):
+            if not self.__started[flow] and self.__flows[flow].getStart() <= timeSlot: # flow has arrived
+                self.startFlow(timeSlot, flow)
+                self.__lastTimeout[flow] = timeSlot
+            # if it has been longer than timeout time slots, put a RREQ packet back in the source node's queue
+            elif self.__started[flow] and self.__discovered[flow] < 0 and timeSlot - self.__lastTimeout[flow] > self.__timeout: # if timeout occurs, source should send out another RREQ
+                self.beginDiscover(timeSlot, flow)
+                self.__lastTimeout[flow] = timeSlot
         
         # record queue length
         num = 0
@@ -180,40 +448,136 @@ class AODVSimulation:
             num += self.__queues.getQueue(node).getBufferLength()
         self.__queueLength += (num / self.__numNodes)       
 
+        # route requests are flooded in batches: consecutive transmitting nodes are collected and
+        # flooded together, as long as no earlier node in the batch could have written to the queue
+        # of the next one. this keeps the result identical to sending one node at a time
+        batch = [] # (node, RREQ) pairs waiting to be flooded
+        touched = set() # nodes whose queues the batch writes to
         for node in transmissions:
+            if node in touched:
+                self.flood(timeSlot, neighborsDict, batch)
+                batch = []
+                touched = set()
             if self.__queues.getQueue(node).getBufferLength(): # if queue is not empty, send packet out to neighbors
                 neighbors = neighborsDict[node]
                 packet = self.__queues.getQueue(node).pullFromBuffer() 
+                if packet.getType() == 'RouteRequest':
+                    batch.append((node, packet))
+                    touched.update(neighbors)
+                    continue
+                self.flood(timeSlot, neighborsDict, batch)
+                batch = []
+                touched = set()
+                flow = packet.getFlow()
+                if packet.getType() == 'Data':
+                    # data follows the cached next hops if there is a cache, otherwise its own route
+                    if self.__cache is not None:
+                        nextHop = self.__cache.lookup(node, packet.getDestination(), timeSlot)
+                    else:
+                        nextHop = packet.getPath()[0]
                 sent = False # if the packet doesn't get sent this whole loop, we need to retransmit it
                 for neighbor in neighbors:
-                    if packet.getType() == 'RouteRequest':
-                        if neighbor == self.__target and not self.__destinationReached: # so we don't send out multiple replies
-                            self.__destinationReached = True
-                            reply = RouteReply(timeSlot, self.__target, self.__source, packet.getPath()[::-1])
-                            self.__queues.getQueue(neighbor).pushToBack(reply)
-                        elif (self.__received[neighbor] is None) or (self.__received[neighbor] < packet.getTimeStamp()):
-                            # if we havent received this request before
-                            newPacket = copy.deepcopy(packet) # copy the packet so we don't have pointers
-                            newPacket.addToPath(neighbor)
-                            self.__queues.getQueue(neighbor).pushToBack(newPacket)
-                            self.__received[neighbor] = packet.getTimeStamp()
-                        sent = True
-                        self.__totalOverhead += 1
                     if packet.getType() == 'RouteReply':
-                        if neighbor == packet.getDestination(): # done with simulation because the reply packet has reached the source
-                            self.__finished = True
-                            self.__totalTimeslots = timeSlot
-                            return
+                        if neighbor == packet.getDestination(): # done with the discovery because the reply packet has reached the source
+                            self.routeFound(timeSlot, flow)
+                            if self.__finished:
+                                return
+                            sent = True
+                            break
                         elif neighbor == packet.getPath()[0]: # the neighbor is the next in the backwards path
                             if packet.getRetransmits() <= self.__retry: 
                                 packet.setPath(packet.getPath()[1:])
                                 self.__queues.getQueue(neighbor).pushToBack(packet)
                                 sent = True
-                                self.__totalOverhead += 1
+                                self.__overhead[flow] += 1
+                            break
+                    if packet.getType() == 'Data':
+                        if neighbor == nextHop: # the neighbor is the next hop on the route
+                            sent = True
+                            self.__overhead[flow] += 1
+                            if neighbor == packet.getDestination():
+                                self.__delivered[flow] += 1
+                                self.__latency[flow] += timeSlot - packet.getTimeStamp()
+                                self.checkFinished(timeSlot)
+                                if self.__finished:
+                                    return
+                            else:
+                                packet.setPath(packet.getPath()[1:])
+                                self.__queues.getQueue(neighbor).pushToBack(packet)
                             break
                 if not sent: # if the packet hasn't been taken out of the queue and sent, we need to retransmit
                     packet.retransmit()
-                    self.__queues.getQueue(node).pushToFront(packet)
+                    if packet.getType() == 'Data' and packet.getRetransmits() > self.__retry: # the route broke, so the data is lost
+                        self.__lost[flow] += 1
+                        self.checkFinished(timeSlot)
+                        if self.__finished:
+                            return
+                    elif packet.getType() == 'RouteReply' and packet.getRetransmits() > self.__retry: # the reverse path broke, so the reply is lost
+                        self.restartDiscovery(flow)
+                    else:
+                        self.__queues.getQueue(node).pushToFront(packet)
+        self.flood(timeSlot, neighborsDict, batch)
+
+    def flood(self, timeSlot, neighborsDict, batch):
+        # sends every RREQ in batch to all neighbors of the node sending it
+        # each (sender, neighbor) pair is one transmission. a neighbor takes the request if its
+        # timestamp is newer than anything the neighbor has received for that flow, including from
+        # earlier pairs in the same batch. the first pair to reach a flow's target sends the route reply
+        if not batch:
+            return
+        counts = np.array([len(neighborsDict[node]) for node, _ in batch], dtype=int)
+        neighbors = np.fromiter((n for node, _ in batch for n in neighborsDict[node]), dtype=int, count=counts.sum())
+        stamps = np.repeat([packet.getTimeStamp() for _, packet in batch], counts)
+        flows = np.repeat([packet.getFlow() for _, packet in batch], counts).astype(int)
+        owners = np.repeat(np.arange(len(batch)), counts) # which batch entry each pair belongs to
+        self.__overhead += np.bincount(flows, minlength=self.__numFlows)
+
+        # pairs that reach their flow's target first
+        hits = np.flatnonzero((neighbors == self.__targets[flows]) & ~self.__destinationReached[flows])
+        _, first = np.unique(flows[hits], return_index=True)
+        replies = np.zeros(len(neighbors), dtype=bool)
+        replies[hits[first]] = True
+        candidates = ~replies # pairs that may deliver a copy of the request
+
+        keys = flows * self.__numNodes + neighbors
+        received = self.__received.reshape(-1) # flat view, indexed by keys
+        accepted = newestOffers(keys, stamps, candidates, received)
+        np.maximum.at(received, keys[accepted], stamps[accepted])
+
+        # enqueue in the same order as sending one pair at a time, since full queues drop packets
+        for i in np.flatnonzero(accepted | replies):
+            neighbor = int(neighbors[i])
+            packet = batch[owners[i]][1]
+            if replies[i]:
+                flow = packet.getFlow()
+                self.__destinationReached[flow] = True
+                path = packet.getPath()
+                self.__routes[flow] = path + [neighbor]
+                self.__queues.getQueue(neighbor).pushToBack(RouteReply(timeSlot, neighbor, path[0], path[::-1], flow))
+            else:
+                self.__queues.getQueue(neighbor).pushToBack(packet.forward(neighbor))
+
+        for k in np.flatnonzero(counts == 0): # nodes with no neighbors couldn't send, so they retransmit
+            node, packet = batch[k]
+            packet.retransmit()
+            self.__queues.getQueue(node).pushToFront(packet)
+
+    def routeFound(self, timeSlot, flow):
+        # the route reply got back to the source: send the flow's data along the route
+        self.__discovered[flow] = timeSlot
+        route = self.__routes[flow]
+        if self.__cache is not None:
+            self.__cache.learn(route, timeSlot)
+        for _ in range(self.__flows[flow].getNumData()):
+            self.__queues.getQueue(route[0]).pushToBack(DataPacket(timeSlot, route[0], route[-1], route[1:], flow))
+        self.checkFinished(timeSlot)
+
+    def checkFinished(self, timeSlot):
+        # the simulation is done once every flow has found its route and accounted for all its data
+        numData = np.array([f.getNumData() for f in self.__flows])
+        if np.all((self.__discovered >= 0) & (self.__delivered + self.__lost >= numData)):
+            self.__finished = True
+            self.__totalTimeslots = timeSlot
                         
     def getQueues(self):
         return self.__queues
@@ -222,7 +586,7 @@ class AODVSimulation:
         return self.__finished
     
     def returnOverhead(self):
-        return self.__totalOverhead
+        return int(self.__overhead.sum())
     
     def returnTimeslots(self):
         return self.__totalTimeslots
@@ -230,10 +594,40 @@ class AODVSimulation:
     def returnQueueUsage(self):
         self.__totalTimeslots = max(1, self.__totalTimeslots)
         return ((self.__queueLength / self.__totalTimeslots) / 10) * 100
+
+    def returnFlowMetrics(self):
+        # one dictionary of measurements per flow
+        # discovery is the number of timeslots from the flow's start until the route was found, -1 if it never was
+        metrics = []
+        for flow in range(self.__numFlows):
+            f = self.__flows[flow]
+            discovery = int(self.__discovered[flow] - f.getStart()) if self.__discovered[flow] >= 0 else -1
+            delivered = int(self.__delivered[flow])
+            metrics.append({'flow': f.getID(), 'source': int(f.getSource()), 'target': int(f.getTarget()),
+                            'start': f.getStart(), 'discovery': discovery, 'reused': bool(self.__reused[flow]),
+                            'overhead': int(self.__overhead[flow]),
+                            'delivered': delivered, 'lost': int(self.__lost[flow]),
+                            'latency': float(self.__latency[flow]) / delivered if delivered else None})
+        return metrics
     
 class OLSRSimulation:
     
-    def __init__(self, source, target, numNodes, timeout=100, retry=5, linkUpdate=50):
+    def __init__(self, source, target, numNodes, timeout=100, retry=5, linkUpdate=50, rng=None, refresh='periodic'):
+        # rng is the numpy Generator used to shuffle neighbors when choosing MPRs
+        # refresh is how link states are sent out:
+        #   'periodic' - every node sends one every linkUpdate timeslots, and routing table entries
+        #                older than linkUpdate are stale
+        #   'adaptive' - every node sends one at the start and then only when its neighborhood
+        #                has changed (see linksChanged), at most once every linkUpdate timeslots.
+        #                an entry is stale once its node has sent a newer one. a link state that no
+        #                reachable MPR takes because one of them has already seen it is dropped
+        #                instead of being retransmitted
+        if refresh not in ('periodic', 'adaptive'):
+            raise ValueError("unknown link state refresh " + str(refresh))
+        if rng is None:
+            rng = np.random.default_rng()
+        self.__rng = rng
+        self.__refresh = refresh
         self.__source = source
         self.__target = target
         self.__numNodes = numNodes
@@ -246,10 +640,13 @@ class OLSRSimulation:
         self.__lastLinkUpdate = 0 # the last time the link state messages were passed around
         self.__received = [None]*self.__numNodes # array of timestamps that record what RREQ packet a node has received (so it doesn't retransmit it)
         self.__MPR = {} # MPRS for each node
-        self.__routingTables = {} # for each node, has a list of the timestamps for when the node received a link state message for that node
+        self.__routingTables = {} # for each node, the timestamp of the newest link state it has seen from each other node. nodes it hasn't heard from are left out
+        self.__originated = np.zeros(self.__numNodes, dtype=int) # timestamp of the newest link state each node sent
+        self.__neighborhoods = None # neighbor sets the last link states were sent for ('adaptive' only)
+        self.__changed = set() # nodes whose neighborhood changed since their last link state ('adaptive' only)
         for node in range(numNodes):
             self.__MPR[node] = []
-            self.__routingTables[node] = [-1]*self.__numNodes
+            self.__routingTables[node] = {}
         self.__numMPR = 0
         self.beginDiscover(0)
         
@@ -265,11 +662,32 @@ class OLSRSimulation:
         self.__queues.getQueue(self.__source).pushToBack(packet)
         self.__received[self.__source] = timeSlot # record the timestamp of the packet
 
-    def refreshState(self, timeSlot):
-        # if it's time to update the link, put a link state message back in all the queues
-        for node in range(self.__numNodes):
+    def refreshState(self, timeSlot, nodes=None):
+        # if it's time to update the link, put a link state message back in the queues of nodes, all of them if None
+        if nodes is None:
+            nodes = range(self.__numNodes)
+        for node in nodes:
             packet = LinkState(timeSlot, node)
             self.__queues.getQueue(node).pushToBack(packet)
+            self.__originated[node] = timeSlot
+            if self.__refresh == 'adaptive':
+                self.__routingTables[node][node] = timeSlot # so its own link state isn't taken back
+
+    def linksChanged(self, timeSlot, neighborsDict, nodeMovement):
+        # the grid mutated. in 'adaptive' mode, the nodes whose neighbors changed are due to send out link states
+        # only the nodes that moved and their old and new neighbors are compared
+        if self.__refresh != 'adaptive' or self.__neighborhoods is None:
+            return
+        moved = [node for node, m in nodeMovement.items() if m]
+        candidates = set(moved)
+        for node in moved:
+            candidates.update(self.__neighborhoods[node])
+            candidates.update(neighborsDict[node])
+        for node in candidates:
+            neighbors = set(neighborsDict[node])
+            if neighbors != self.__neighborhoods[node]:
+                self.__neighborhoods[node] = neighbors
+                self.__changed.add(node)
         
     def chooseMPR(self, grid, numNodes, neighborsDict):
         # gather all two-hop neighbors
@@ -282,7 +700,7 @@ class OLSRSimulation:
                         twoHopNeighbors.add(twoHop)
             # now find MPRs
             shuffledNeighbors = copy.deepcopy(neighborsDict[node])
-            np.random.shuffle(shuffledNeighbors)
+            self.__rng.shuffle(shuffledNeighbors)
             for neighbor in shuffledNeighbors:
                 intersection = twoHopNeighbors & set(neighborsDict[neighbor])
                 if len(intersection):
@@ -297,7 +715,16 @@ class OLSRSimulation:
             self.__lastTimeout = timeSlot
         
         # if it has been longer than linkUpdate time slots, all the nodes should send out link states again
-        if (timeSlot - self.__lastLinkUpdate > self.__linkUpdate) or timeSlot == 0:
+        # in 'adaptive' mode they only all do at the start, after that linksChanged sends them
+        if self.__refresh == 'adaptive':
+            if timeSlot == 0:
+                self.__neighborhoods = {node: set(neighbors) for node, neighbors in neighborsDict.items()}
+                self.refreshState(timeSlot)
+            elif self.__changed:
+                due = sorted(node for node in self.__changed if timeSlot - self.__originated[node] > self.__linkUpdate)
+                self.__changed.difference_update(due)
+                self.refreshState(timeSlot, due)
+        elif (timeSlot - self.__lastLinkUpdate > self.__linkUpdate) or timeSlot == 0:
             self.refreshState(timeSlot)
             self.__lastLinkUpdate = timeSlot
 
@@ -312,34 +739,42 @@ class OLSRSimulation:
                 MPRs = self.__MPR[node]
                 packet = self.__queues.getQueue(node).pullFromBuffer() 
                 sent = False # if the packet doesn't get sent this whole loop, we need to retransmit it
+                seen = False # if a reachable MPR already has this link state
                 for MPR in MPRs: # packets are only forwarded to MPRs
                     if MPR in neighborsDict[node]: # since we don't update MPRs at every time step, we should make sure they are still neighbors
                         table = self.__routingTables[MPR] # routing table for the MPR
                         if packet.getType() == 'RouteRequest':
                             # if the destination is in the neighbor's routing table and it's up to date, then there is a route and we've finished
-                            if (packet.getDestination() == MPR) or ((table[packet.getDestination()] > 0) and (table[packet.getDestination()] + self.__linkUpdate >= timeSlot)):
+                            if (packet.getDestination() == MPR) or self.isFresh(table, packet.getDestination(), timeSlot):
                                 self.__finished = True
                                 self.__totalTimeslots = timeSlot
                                 return
                             elif (self.__received[MPR] is None) or (self.__received[MPR] < packet.getTimeStamp()):
                                 # if we havent received this request before
-                                newPacket = copy.deepcopy(packet) # copy the packet so we don't have pointers
-                                newPacket.addToPath(MPR)
-                                self.__queues.getQueue(MPR).pushToBack(newPacket)
+                                self.__queues.getQueue(MPR).pushToBack(packet.forward(MPR))
                                 self.__received[MPR] = packet.getTimeStamp()
                                 sent = True
                                 self.__totalOverhead += 1
                         if packet.getType() == 'LinkState':
-                            if table[packet.getSource()] < packet.getTimeStamp(): # only send the packet if it's new and hasn't been seen before
+                            if table.get(packet.getSource(), -1) < packet.getTimeStamp(): # only send the packet if it's new and hasn't been seen before
                                 table[packet.getSource()] = packet.getTimeStamp()
-                                newPacket = copy.deepcopy(packet) # copy the packet so we don't have pointers
-                                newPacket.addToPath(MPR)
-                                self.__queues.getQueue(MPR).pushToBack(newPacket)
+                                self.__queues.getQueue(MPR).pushToBack(packet.forward(MPR))
                                 self.__totalOverhead += 1
                                 sent = True
+                            else:
+                                seen = True
                 if not sent:
+                    if seen and self.__refresh == 'adaptive':
+                        continue # a duplicate: a reachable MPR has it already. with no reachable MPR it is retransmitted
                     packet.retransmit()
-                    self.__queues.getQueue(node).pushToFront(packet)        
+                    self.__queues.getQueue(node).pushToFront(packet)
+
+    def isFresh(self, table, node, timeSlot):
+        # whether a routing table has up to date link state for node
+        if self.__refresh == 'adaptive':
+            return table.get(node, -1) >= self.__originated[node]
+        return (table.get(node, -1) > 0) and (table[node] + self.__linkUpdate >= timeSlot)
+
         
     def returnOverhead(self):
         return self.__totalOverhead
@@ -370,7 +805,10 @@ class CustomSimulation:
         self.__lastTimeout = 0 # time at which the last timeout occurred
         self.__received = [-1]*self.__numNodes # array of timestamps that record what RREQ packet a node has received (so it doesn't retransmit it)
         self.__replyReceived = [-1]*self.__numNodes # whether a node has gotten a route reply or not so it doesnt send it again
-        self.__graphNums = [0]*self.__numNodes # keeps track of how many times a node has moved
+        self.__graphNums = np.zeros(self.__numNodes, dtype=int) # keeps track of how many times a node has moved
+        self.__orderedNeighbors = None # neighbors of every node sorted by graph number, rebuilt after graph numbers change
+        self.__orderedPointers = None # node i's sorted neighbors are __orderedNeighbors[__orderedPointers[i]:__orderedPointers[i+1]]
+        self.__orderedFrom = None # the neighbors dictionary the ordering was built from
         self.__brokenPath = False # if the path on the way back is broken, we have to broadcast the packet
         self.__destinationReached = False # if the target node has been reached with an RREQ
 
@@ -393,7 +831,7 @@ class CustomSimulation:
         
         for node in transmissions:
             if self.__queues.getQueue(node).getBufferLength(): # if queue is not empty, send packet out to neighbors
-                neighbors = self.pickNeighbors(copy.deepcopy(neighborsDict[node])) # order neighbors by graph number: smallest to largest
+                neighbors = self.pickNeighbors(node, neighborsDict) # order neighbors by graph number: smallest to largest
                 packet = self.__queues.getQueue(node).pullFromBuffer() 
                 sent = 0 # WAS THE ROUTE REPLY SENT DEGREE NUMBER OF TIMES?
                 requestSent = 0 # WAS AN RREQ SENT DEGREE NUMBER OF TIMES?
@@ -441,12 +879,28 @@ class CustomSimulation:
         return self.__finished
 
     def updateGraphNums(self, nodeMovement):
-        self.__graphNums += nodeMovement
-
-    def pickNeighbors(self, neighbors):
-        neighborGraphNums = [self.__graphNums[i] for i in neighbors]
-        neighbors = [x for _,x in sorted(zip(neighborGraphNums, neighbors))]
-        return neighbors
+        self.__graphNums += np.array([nodeMovement.get(node, 0) for node in range(self.__numNodes)], dtype=int)
+        self.__orderedNeighbors = None # graph numbers changed, so the neighbor ordering has to be rebuilt
+
+    def orderNeighbors(self, neighborsDict):
+        # sorts the neighbors of every node by graph number (ties broken by node number) in one pass:
+        # lay the neighbor lists out end to end and argsort by (node, graph number, neighbor)
+        counts = np.array([len(neighborsDict.get(node, [])) for node in range(self.__numNodes)], dtype=int)
+        pointers = np.zeros(self.__numNodes + 1, dtype=int)
+        np.cumsum(counts, out=pointers[1:])
+        neighbors = np.fromiter((n for node in range(self.__numNodes) for n in neighborsDict.get(node, [])), dtype=int, count=pointers[-1])
+        rows = np.repeat(np.arange(self.__numNodes), counts)
+        order = np.lexsort((neighbors, self.__graphNums[neighbors], rows))
+        self.__orderedNeighbors = neighbors[order].tolist()
+        self.__orderedPointers = pointers.tolist()
+        self.__orderedFrom = neighborsDict
+
+    def pickNeighbors(self, node, neighborsDict):
+        # neighbors of node ordered by graph number: smallest to largest
+        # the ordering is cached until the graph numbers or the neighbors dictionary change
+        if (self.__orderedNeighbors is None) or (self.__orderedFrom is not neighborsDict):
+            self.orderNeighbors(neighborsDict)
+        return self.__orderedNeighbors[self.__orderedPointers[node]:self.__orderedPointers[node+1]]
 
     def beginDiscover(self, timeSlot):
         # put route request packet into source's queue. This happens at the beginning and when we reach timeout